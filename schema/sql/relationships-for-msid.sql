@@ -0,0 +1,113 @@
+--\timing
+--EXPLAIN ANALYSE
+
+-- find all of the relationships for the most recent version of the given manuscript-id in a single query.
+-- returns a single row with the relationships as a JSON array, or no rows if the article doesn't exist (or
+-- hasn't been published).
+-- external citations precede reviewed-preprints that precede the snippets of related articles.
+
+-- `%(latest)s` is either 'latest_articleversion_id' or 'latest_published_articleversion_id' and is kept
+-- up to date by `logic.update_latest_versions`.
+
+WITH target AS (
+    -- the most recent article version of the given manuscript-id
+    SELECT
+        a.id AS article_id,
+        a.%(latest)s AS av_id
+    FROM
+        publisher_article a
+    WHERE
+        a.manuscript_id = %(msid)s
+    AND
+        a.%(latest)s IS NOT NULL
+),
+
+internal AS (
+    -- the most recent version of every article the target points to ...
+    SELECT
+        a.%(latest)s AS av_id
+    FROM
+        target,
+        publisher_articleversionrelation avr,
+        publisher_article a
+    WHERE
+        avr.articleversion_id = target.av_id
+    AND
+        a.id = avr.related_to_id
+    AND
+        a.%(latest)s IS NOT NULL
+
+    UNION
+
+    -- ... and the most recent version of every article pointing to the target.
+    -- earlier versions pointing to the target are ignored.
+    SELECT
+        a.%(latest)s AS av_id
+    FROM
+        target,
+        publisher_articleversionrelation avr,
+        publisher_article a
+    WHERE
+        avr.related_to_id = target.article_id
+    AND
+        a.%(latest)s = avr.articleversion_id
+),
+
+snippets AS (
+    SELECT
+        avj.article_json_v1_snippet AS content,
+        avj.article_json_v1_snippet::json->>'id' AS id
+    FROM
+        internal,
+        publisher_articleversionjson avj
+    WHERE
+        avj.articleversion_id = internal.av_id
+    AND
+        avj.article_json_v1_snippet IS NOT NULL
+    AND
+        avj.article_json_v1_snippet != 'null'
+),
+
+related AS (
+    SELECT
+        1 AS grp, avext.id AS pos, '' AS id, avext.citation AS content
+    FROM
+        target,
+        publisher_articleversionextrelation avext
+    WHERE
+        avext.articleversion_id = target.av_id
+
+    UNION ALL
+
+    -- lsh@2023-11-17: exclude any rpp that has a matching msid for a POA or VOR relation.
+    -- - https://github.com/elifesciences/issues/issues/8529
+    SELECT
+        2, avrpp.id, '', rpp.content
+    FROM
+        target,
+        publisher_articleversionreviewedpreprintrelation avrpp,
+        publisher_reviewedpreprint rpp
+    WHERE
+        %(include_rpp)s
+    AND
+        avrpp.articleversion_id = target.av_id
+    AND
+        rpp.id = avrpp.reviewedpreprint_id
+    AND
+        rpp.content::json->>'id' NOT IN (SELECT id FROM snippets)
+
+    UNION ALL
+
+    -- snippets are ordered by their (string) id
+    SELECT
+        3, 0, snippets.id, snippets.content
+    FROM
+        snippets
+)
+
+SELECT
+    '[' || coalesce(
+        (SELECT string_agg(content, ', ' ORDER BY grp, pos, id) FROM related), ''
+    ) || ']' AS content
+FROM
+    target
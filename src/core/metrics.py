@@ -0,0 +1,355 @@
+"""a small registry of counters and histograms, exposed in the Prometheus text format at `/metrics`.
+
+each process keeps its own values. when `METRICS_DIR` is configured, each process also writes
+its values to a file in that directory (at most once every `WRITE_INTERVAL` seconds, and when
+they're collected or the process exits) and the values in every file are summed when exposed.
+this lets any one of several uwsgi workers report the metrics for all of them. the values of
+workers that have exited are moved into a single archive file when metrics are collected, so totals
+never go backwards and the number of files doesn't grow as workers are recycled.
+the directory must be emptied when the application is deployed or (re)started."""
+
+import atexit
+from collections import defaultdict
+from contextlib import contextmanager
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+from django.conf import settings
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# seconds
+WRITE_INTERVAL = 1
+
+# the values of processes that have exited, see `Registry.archive`
+ARCHIVE = "metrics-archive.json"
+
+# seconds, from 5ms to 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        # (sample name, labels) => value
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.written = 0
+        # values have been added since they were last written
+        self.changed = False
+        # this process has written its values at least once
+        self.started = False
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, samples):
+        "adds each `(sample name, labels, amount)` in `samples` to this process's values."
+        with self.lock:
+            self._forked()
+            for name, labels, amount in samples:
+                self.values[(name, labels)] += amount
+            self.changed = True
+        if settings.METRICS_DIR and time.monotonic() - self.written > WRITE_INTERVAL:
+            self.write()
+
+    def _forked(self):
+        "clears the values copied from the parent process after a fork. call with the lock held."
+        if self.pid != os.getpid():
+            self.values.clear()
+            self.changed = False
+            self.started = False
+            self.pid = os.getpid()
+
+    def path(self, pid):
+        return os.path.join(settings.METRICS_DIR, "metrics-%s.json" % pid)
+
+    def write(self):
+        "writes this process's values to the `METRICS_DIR`"
+        with self.lock:
+            # a forked process doesn't write the values of its parent
+            self._forked()
+            self.written = time.monotonic()
+            self.changed = False
+            started, self.started = self.started, True
+            rows = [
+                [name, labels, value] for (name, labels), value in self.values.items()
+            ]
+        if not started:
+            # a file for this pid was written by an earlier process with the same pid
+            self.archive(own=True)
+        path = self.path(os.getpid())
+        try:
+            _dump(path, rows)
+        except OSError:
+            LOG.exception("failed to write metrics to %s", path)
+
+    def flush(self):
+        "writes this process's values to the `METRICS_DIR` if they've changed since they were last written"
+        if settings.METRICS_DIR and self.changed:
+            self.write()
+
+    def archive(self, own=False):
+        """adds the values of processes that have exited to the `ARCHIVE` file and removes their files.
+        `own=True` also archives the file for this process's pid."""
+        archive_path = os.path.join(settings.METRICS_DIR, ARCHIVE)
+        try:
+            with open(os.path.join(settings.METRICS_DIR, "metrics.lock"), "a") as lock:
+                # only one process at a time, a file must be archived exactly once
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                exited = []
+                for path in glob.glob(
+                    os.path.join(settings.METRICS_DIR, "metrics-*.json")
+                ):
+                    match = re.search(r"metrics-(\d+)\.json$", path)
+                    if not match:
+                        continue
+                    pid = int(match.group(1))
+                    if pid == os.getpid():
+                        if own:
+                            exited.append(path)
+                    elif not _alive(pid):
+                        exited.append(path)
+                if not exited:
+                    return
+                totals = defaultdict(float)
+                for path in [archive_path] + exited:
+                    if os.path.exists(path):
+                        _sum(totals, _load(path))
+                _dump(
+                    archive_path,
+                    [[name, labels, value] for (name, labels), value in totals.items()],
+                )
+                for path in exited:
+                    os.remove(path)
+        except (OSError, ValueError):
+            LOG.exception("failed to archive metrics in %s", settings.METRICS_DIR)
+
+    def collect(self):
+        "returns the values of this process, summed with the values of all other processes if configured."
+        with self.lock:
+            self._forked()
+            totals = defaultdict(float, self.values)
+        if not settings.METRICS_DIR:
+            return totals
+        self.flush()
+        self.archive()
+        this_process = self.path(os.getpid())
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics-*.json")):
+            if path == this_process:
+                continue
+            try:
+                rows = _load(path)
+            except (OSError, ValueError):
+                LOG.warning("failed to read metrics from %s", path)
+                continue
+            _sum(totals, rows)
+        return totals
+
+    def exposition(self):
+        "returns all metrics in the Prometheus text format"
+        totals = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            names = metric.sample_names()
+
+            def order(key):
+                # histogram samples are grouped by their labels, buckets in ascending order
+                name, labels = key
+                other_labels = tuple(label for label in labels if label[0] != "le")
+                return (
+                    other_labels,
+                    names.index(name),
+                    float(dict(labels).get("le", 0)),
+                )
+
+            samples = sorted(
+                ((key, value) for key, value in totals.items() if key[0] in names),
+                key=lambda sample: order(sample[0]),
+            )
+            for (name, labels), value in samples:
+                lines.append(
+                    "%s%s %s" % (name, format_labels(labels), format_value(value))
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    "returns `True` if a process with the given `pid` exists"
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but belongs to another user
+        pass
+    return True
+
+
+def _load(path):
+    "returns the rows of `[name, labels, value]` in the metrics file at `path`"
+    with open(path, "r") as fh:
+        return json.load(fh)
+
+
+def _dump(path, rows):
+    "replaces the metrics file at `path` with the given rows of `[name, labels, value]`"
+    with open(path + ".tmp", "w") as fh:
+        json.dump(rows, fh)
+    os.replace(path + ".tmp", path)
+
+
+def _sum(totals, rows):
+    "adds the values in `rows` read from a metrics file to `totals`"
+    for name, labels, value in rows:
+        totals[(name, tuple(map(tuple, labels)))] += value
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = [
+        '%s="%s"' % (key, str(val).replace("\\", r"\\").replace('"', r"\""))
+        for key, val in labels
+    ]
+    return "{%s}" % ",".join(pairs)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _labels(labelnames, labels):
+    assert set(labels) == set(labelnames), "expecting labels %s, got %s" % (
+        labelnames,
+        list(labels),
+    )
+    return tuple((name, str(labels[name])) for name in labelnames)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.register(self)
+
+    def sample_names(self):
+        return [self.name]
+
+    def inc(self, amount=1, **labels):
+        self.registry.add([(self.name, _labels(self.labelnames, labels), amount)])
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float("inf"),)
+        registry.register(self)
+
+    def sample_names(self):
+        return [self.name + "_bucket", self.name + "_sum", self.name + "_count"]
+
+    def observe(self, value, **labels):
+        labels = _labels(self.labelnames, labels)
+        # buckets are cumulative, a value is counted in every bucket it fits in.
+        # the others are added to so that every bucket is present.
+        samples = [
+            (
+                self.name + "_bucket",
+                labels + (("le", format_value(bound)),),
+                int(value <= bound),
+            )
+            for bound in self.buckets
+        ]
+        samples.append((self.name + "_sum", labels, value))
+        samples.append((self.name + "_count", labels, 1))
+        self.registry.add(samples)
+
+    @contextmanager
+    def time(self, **labels):
+        "observes the seconds spent within this context"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+REGISTRY = Registry()
+# values added since the last write would otherwise be lost
+atexit.register(REGISTRY.flush)
+
+#
+# metrics
+#
+
+REQUESTS = Counter(
+    REGISTRY,
+    "lax_http_requests_total",
+    "HTTP requests by view, method and response status.",
+    ("view", "method", "status"),
+)
+REQUEST_LATENCY = Histogram(
+    REGISTRY,
+    "lax_http_request_duration_seconds",
+    "HTTP request latency by view.",
+    ("view",),
+)
+RESPONSE_CACHE = Counter(
+    REGISTRY,
+    "lax_response_cache_total",
+    "API response cache lookups by result, 'hit' or 'miss'.",
+    ("result",),
+)
+INGEST = Counter(
+    REGISTRY,
+    "lax_ingest_total",
+    "INGEST and PUBLISH requests by action and outcome, 'success', 'identical' or an error code.",
+    ("action", "outcome"),
+)
+INGEST_LATENCY = Histogram(
+    REGISTRY,
+    "lax_ingest_duration_seconds",
+    "INGEST and PUBLISH request latency by action.",
+    ("action",),
+)
+VALIDATION_LATENCY = Histogram(
+    REGISTRY,
+    "lax_validation_duration_seconds",
+    "article-json validation latency by schema.",
+    ("schema",),
+)
+VALIDATION_CACHE = Counter(
+    REGISTRY,
+    "lax_validation_cache_total",
+    "article-json validation cache lookups by result, 'hit' or 'miss'.",
+    ("result",),
+)
+MERGE_LATENCY = Histogram(
+    REGISTRY, "lax_merge_duration_seconds", "article fragment merge latency."
+)
+NOTIFY_LATENCY = Histogram(
+    REGISTRY, "lax_event_bus_notify_duration_seconds", "event bus notification latency."
+)
@@ -1,5 +1,13 @@
+from contextlib import ExitStack
+import cProfile
+import os
+import random
+import time
+import uuid
 from django.conf import settings
+from django.db import connections
 import logging
+from core import metrics, routers, timing
 from django.utils.deprecation import MiddlewareMixin
 from django.views.decorators.cache import patch_cache_control
 from django.utils.cache import patch_vary_headers
@@ -42,6 +50,100 @@ class KongAuthentication(MiddlewareMixin):
             set_authenticated(request, state=False)
 
 
+class ReplicaReads(object):
+    """sends the database reads of unauthenticated GET and HEAD requests to the API to the replica database.
+    authenticated requests always read from the primary so previews of newly ingested
+    article versions are never behind."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            routers.replica()
+            and request.method in ["GET", "HEAD"]
+            and request.path.startswith("/api/")
+            and not request.META[settings.KONG_AUTH_HEADER]
+        ):
+            with routers.replica_reads():
+                return self.get_response(request)
+        return self.get_response(request)
+
+
+class ServerTiming(object):
+    """records database, serialisation, view and middleware timings for each request.
+    timings are returned in a 'Server-Timing' header and logged when `REQUEST_TIMING` is enabled.
+    a cProfile dump is written for a `PROFILE_SAMPLE_RATE` fraction of requests.
+    must be the first middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = random.random() < settings.PROFILE_SAMPLE_RATE
+        if not settings.REQUEST_TIMING and not profile:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile() if profile else None
+        with timing.recording() as timings, ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timing.record_query))
+            if profiler:
+                profiler.enable()
+            with timing.timed("total"):
+                response = self.get_response(request)
+            if profiler:
+                profiler.disable()
+
+        if profiler:
+            fname = "lax-%s-%s.prof" % (int(time.time()), uuid.uuid4().hex[:8])
+            path = os.path.join(settings.PROFILE_DIR, fname)
+            profiler.dump_stats(path)
+            LOG.info(
+                "wrote profile for %s %s to %s", request.method, request.path, path
+            )
+
+        if settings.REQUEST_TIMING:
+            response["Server-Timing"] = timings.header()
+            fields = {
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                **timings.log_fields(),
+            }
+            LOG.info("request timings", extra=fields)
+
+        return response
+
+
+def request_metrics(get_response):
+    "counts requests and observes their latency by view name for `/metrics`."
+
+    def middleware(request):
+        start = time.perf_counter()
+        response = get_response(request)
+        elapsed = time.perf_counter() - start
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unresolved"
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view)
+        metrics.REQUESTS.inc(
+            view=view, method=request.method, status=response.status_code
+        )
+        return response
+
+    return middleware
+
+
+def view_timing(get_response):
+    "times the view, including URL resolution. must be the last middleware."
+
+    def middleware(request):
+        with timing.timed("view"):
+            return get_response(request)
+
+    return middleware
+
+
 #
 #
 #
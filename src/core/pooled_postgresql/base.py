@@ -0,0 +1,192 @@
+"""a PostgreSQL database backend that keeps connections in a pool shared by all threads
+instead of connecting and disconnecting for every request.
+
+configured with a 'POOL' map in the database settings, see `core.settings`."""
+
+from collections import deque
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+import logging
+
+LOG = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # connections opened by `DatabaseWrapper.warm_up`
+    "MIN_SIZE": 1,
+    # connections open at any one time, including those in use
+    "MAX_SIZE": 10,
+    # seconds an unused connection is kept for.
+    # keep this below any idle timeout enforced by the database server.
+    "IDLE_TIMEOUT": 240,
+    # seconds an unused connection can go without being checked before it's used
+    "HEALTH_CHECK_INTERVAL": 30,
+    # seconds to wait for a connection when the pool is exhausted
+    "TIMEOUT": 10,
+}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class Pool:
+    "a thread-safe pool of at most `MAX_SIZE` database connections."
+
+    def __init__(self, **options):
+        self.options = {**DEFAULTS, **options}
+        # (connection, time returned) pairs, most recently returned last
+        self.idle = deque()
+        # all open connections, idle or in use
+        self.size = 0
+        self.cond = threading.Condition()
+
+    def _usable(self, conn, returned):
+        "returns `True` if the idle connection `conn` hasn't expired and can still be used."
+        idle_for = time.monotonic() - returned
+        if conn.closed or idle_for > self.options["IDLE_TIMEOUT"]:
+            return False
+        if idle_for < self.options["HEALTH_CHECK_INTERVAL"]:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not conn.autocommit:
+                # don't leave the check's transaction open, django can't change
+                # the autocommit mode of a connection inside one.
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _discard(self, conn):
+        "closes `conn` and frees its place in the pool."
+        self._close(conn)
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+
+    def _sweep(self):
+        """removes every idle connection that has expired and frees their places in the pool.
+        must be called holding `cond`. returns the removed connections, to be closed once `cond` is released."""
+        expired = []
+        cutoff = time.monotonic() - self.options["IDLE_TIMEOUT"]
+        # oldest first
+        while self.idle and self.idle[0][1] < cutoff:
+            expired.append(self.idle.popleft()[0])
+        if expired:
+            self.size -= len(expired)
+            self.cond.notify(len(expired))
+        return expired
+
+    def get(self, connect):
+        """returns an idle connection or, if there are none and the pool isn't full, the result of
+        calling `connect`. waits `TIMEOUT` seconds for a connection to be returned if the pool is full.
+        """
+        while True:
+            with self.cond:
+                expired = self._sweep()
+            for expired_conn in expired:
+                self._close(expired_conn)
+
+            conn = None
+            with self.cond:
+                while not self.idle and self.size >= self.options["MAX_SIZE"]:
+                    if not self.cond.wait(self.options["TIMEOUT"]):
+                        raise PoolTimeout(
+                            "timed out waiting for one of %s database connections"
+                            % self.options["MAX_SIZE"]
+                        )
+                if self.idle:
+                    conn, returned = self.idle.pop()
+                else:
+                    self.size += 1
+
+            if conn is None:
+                try:
+                    return connect()
+                except BaseException:
+                    with self.cond:
+                        self.size -= 1
+                        self.cond.notify()
+                    raise
+
+            if self._usable(conn, returned):
+                return conn
+            self._discard(conn)
+
+    def put(self, conn):
+        "returns `conn` to the pool. connections are never left idle in a transaction."
+        try:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_INTRANS:
+                conn.rollback()
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                # broken, or still busy with a query
+                self._discard(conn)
+                return
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self.cond:
+            self.idle.append((conn, time.monotonic()))
+            self.cond.notify()
+            expired = self._sweep()
+        for expired_conn in expired:
+            self._close(expired_conn)
+
+    def stats(self):
+        with self.cond:
+            return {"size": self.size, "idle": len(self.idle)}
+
+
+# one pool per set of connection parameters
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def pool(self, conn_params=None):
+        conn_params = conn_params or self.get_connection_params()
+        key = (self.alias, tuple(sorted(conn_params.items())))
+        with POOLS_LOCK:
+            if key not in POOLS:
+                POOLS[key] = Pool(**self.settings_dict.get("POOL", {}))
+            return POOLS[key]
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return self.pool(conn_params).get(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool().put(self.connection)
+
+    def warm_up(self, prime=None):
+        """opens the pool's `MIN_SIZE` connections ahead of any requests.
+        `prime` is called with a cursor for each connection.
+        errors are raised as django's `DatabaseError`, as they are for any other connection."""
+        conn_params = self.get_connection_params()
+        pool = self.pool(conn_params)
+        connect = super().get_new_connection
+        conn_list = []
+        try:
+            with self.wrap_database_errors:
+                for _ in range(pool.options["MIN_SIZE"]):
+                    conn = pool.get(lambda: connect(conn_params))
+                    conn_list.append(conn)
+                    if prime:
+                        with conn.cursor() as cursor:
+                            prime(cursor)
+                        conn.commit()
+        finally:
+            for conn in conn_list:
+                pool.put(conn)
@@ -0,0 +1,48 @@
+"""routes database reads to an optional read-only replica.
+
+reads are only sent to the replica while `replica_reads` is in effect, see
+`core.middleware.ReplicaReads`. everything else, including writes, migrations and any
+read outside of an unauthenticated API request, uses the 'default' (primary) database."""
+
+from contextlib import contextmanager
+import threading
+from django.conf import settings
+
+_state = threading.local()
+
+
+def replica():
+    "returns the alias of the replica database or `None` if one hasn't been configured."
+    return settings.DATABASE_REPLICA
+
+
+def reading_from_replica():
+    return bool(replica() and getattr(_state, "replica_reads", False))
+
+
+@contextmanager
+def replica_reads():
+    "reads within this context are sent to the replica, if one is configured."
+    previous = getattr(_state, "replica_reads", False)
+    _state.replica_reads = True
+    try:
+        yield
+    finally:
+        _state.replica_reads = previous
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return replica()
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
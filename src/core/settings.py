@@ -83,6 +83,8 @@ INSTALLED_APPS = (
 # order is tricky here.
 # the request descends this list and responses ascend.
 MIDDLEWARE = [
+    "core.middleware.ServerTiming",  # 'Server-Timing' header, timing logs and profiling
+    "core.middleware.request_metrics",  # request counts and latency by view for `/metrics`
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -90,15 +92,13 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    # content types are deprecated before being removed entirely
-    "publisher.middleware.mark_deprecated",
     "core.middleware.KongAuthentication",  # sets a header if it looks like an authenticated request
+    "core.middleware.ReplicaReads",  # unauthenticated API reads use the replica database, if any
     "publisher.middleware.error_content_check",
-    # order is important here.
-    "publisher.middleware.content_check",
-    "publisher.middleware.downgrade_poa_content_type",
-    "publisher.middleware.downgrade_vor_content_type",
+    # content negotiation, downgrading and deprecation
+    "publisher.middleware.negotiate_content",
     "core.middleware.DownstreamCaching",
+    "core.middleware.view_timing",
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -154,9 +154,58 @@ DATABASES = {
         "PASSWORD": cfg("database.password"),
         "HOST": cfg("database.host"),
         "PORT": cfg("database.port"),
+        "CONN_MAX_AGE": CONN_MAX_AGE,
     }
 }
 
+# database connections can be shared between threads in a pool by configuring a maximum pool size.
+# see `core.pooled_postgresql` for defaults. for example:
+# [database]
+# pool-max-size: 10
+# pool-min-size: 2 # opened when the app starts
+# pool-idle-timeout: 240 # seconds
+# pool-health-check-interval: 30 # seconds an idle connection can go unchecked before it's used
+# pool-timeout: 10 # seconds to wait for a connection when all are in use
+if cfg("database.pool-max-size", None):
+    DATABASES["default"].update(
+        {
+            "ENGINE": "core.pooled_postgresql",
+            # connections are returned to the pool at the end of each request
+            "CONN_MAX_AGE": 0,
+            "POOL": {
+                "MIN_SIZE": int(cfg("database.pool-min-size", 1)),
+                "MAX_SIZE": int(cfg("database.pool-max-size")),
+                "IDLE_TIMEOUT": int(cfg("database.pool-idle-timeout", 240)),
+                "HEALTH_CHECK_INTERVAL": int(
+                    cfg("database.pool-health-check-interval", 30)
+                ),
+                "TIMEOUT": int(cfg("database.pool-timeout", 10)),
+            },
+        }
+    )
+
+# unauthenticated GET and HEAD requests to the API can be served from a read-only replica
+# of the primary database by configuring a 'database-replica' section. for example:
+# [database-replica]
+# host: replica.example.org
+# port: 5432
+# any value not given is taken from the 'database' section.
+DATABASE_REPLICA = None
+if cfg("database-replica.host", None):
+    DATABASE_REPLICA = "replica"
+    DATABASES[DATABASE_REPLICA] = {
+        **DATABASES["default"],
+        "NAME": cfg("database-replica.name", DATABASES["default"]["NAME"]),
+        "USER": cfg("database-replica.user", DATABASES["default"]["USER"]),
+        "PASSWORD": cfg("database-replica.password", DATABASES["default"]["PASSWORD"]),
+        "HOST": cfg("database-replica.host"),
+        "PORT": cfg("database-replica.port", DATABASES["default"]["PORT"]),
+        # the test runner shouldn't create a separate test database for the replica
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -260,10 +309,7 @@ API_OPTS = render_item(
 
 SQL_PATH = join(PROJECT_DIR, "schema", "sql")
 SQL_LIST = [
-    "internal-relationships-for-msid.sql",
-    "internal-reverse-relationships-for-msid.sql",
-    "external-relationships-for-msid.sql",
-    "reviewed-preprints-for-av-id.sql",
+    "relationships-for-msid.sql",
 ]
 SQL_MAP = {
     os.path.basename(path): open(os.path.join(SQL_PATH, path), "r").read()
@@ -398,7 +444,48 @@ LOGGING["loggers"].update(
     dict(list(zip(module_loggers, [logger] * len(module_loggers))))
 )
 
+# returns database, serialisation, view and middleware timings in a 'Server-Timing' header and logs them.
+REQUEST_TIMING = cfg("general.request-timing", False)
+
+# fraction of requests, 0.0 to 1.0, to write a cProfile dump for in `PROFILE_DIR`.
+PROFILE_SAMPLE_RATE = float(cfg("general.profile-sample-rate", 0))
+PROFILE_DIR = cfg("general.profile-dir", "/tmp")
+
+# directory each process writes its metrics to so `/metrics` can report those of all processes.
+# required when there are multiple uwsgi workers. see `core.metrics`.
+# the directory must be emptied on each deploy and whenever the application is (re)started.
+METRICS_DIR = cfg("general.metrics-dir", None)
+
+# article-json found to be valid is recorded and not validated against the same schema again.
+# see `publisher.models.ValidationResult`.
+VALIDATION_CACHE = cfg("general.validation-cache", True)
+
 # 5 minutes, 300 seconds by default
 CACHE_HEADERS_TTL = cfg("general.cache-headers-ttl", 60 * 5)
 
+# seconds the article list 'total' is cached for. counts are also cleared when an article
+# version is ingested or published, the TTL covers other processes with their own cache.
+ARTICLE_COUNT_TTL = int(cfg("general.article-count-ttl", 60))
+
+# maximum number of rendered article responses each process keeps in memory. 0 disables.
+# see `publisher.response_cache`.
+RESPONSE_CACHE_SIZE = int(cfg("general.response-cache-size", 0))
+RESPONSE_CACHE_TTL = int(cfg("general.response-cache-ttl", 60))
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+# rendered article responses can be shared between processes by configuring a 'responses' cache.
+# it replaces the in-process cache above. for example:
+# [response-cache]
+# backend: django.core.cache.backends.memcached.PyMemcacheCache
+# location: 127.0.0.1:11211
+if cfg("response-cache.backend", None):
+    CACHES["responses"] = {
+        "BACKEND": cfg("response-cache.backend"),
+        "LOCATION": cfg("response-cache.location", ""),
+        "TIMEOUT": RESPONSE_CACHE_TTL,
+    }
+
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
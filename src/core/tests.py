@@ -1,6 +1,17 @@
+import os
+import pstats
+import tempfile
+import time
+from unittest.mock import patch, Mock
+import psycopg2
+from psycopg2 import extensions
 from django.conf import settings
-from django.test import TestCase, Client, override_settings
-from core import middleware as mware
+from django.db import connection, DatabaseError
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.urls import reverse
+from core import middleware as mware, routers
+from core.pooled_postgresql import base as pooled
+from publisher import logic
 
 
 class KongAuthMiddleware(TestCase):
@@ -78,3 +89,191 @@ class DownstreamCaching(TestCase):
         return [
             directive.strip() for directive in resp.get("Cache-Control", "").split(",")
         ]
+
+
+class ReplicaRouting(TestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.rf = RequestFactory()
+
+    def reads_from_replica(self, request, authenticated=False):
+        "returns `True` if the database reads made while handling `request` use the replica"
+        mware.set_authenticated(request, state=authenticated)
+        return mware.ReplicaReads(lambda _: routers.reading_from_replica())(request)
+
+    def test_no_replica(self):
+        "the primary is always used if a replica hasn't been configured"
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(None), "default")
+        self.assertFalse(self.reads_from_replica(self.rf.get("/api/v2/articles")))
+
+    @override_settings(DATABASE_REPLICA="replica")
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(None), "default")
+        with routers.replica_reads():
+            self.assertEqual(self.router.db_for_read(None), "replica")
+            self.assertEqual(self.router.db_for_write(None), "default")
+        self.assertEqual(self.router.db_for_read(None), "default")
+
+    @override_settings(DATABASE_REPLICA="replica")
+    def test_replica_reads(self):
+        "only unauthenticated reads from the API use the replica"
+        cases = [
+            (self.rf.get("/api/v2/articles"), False, True),
+            (self.rf.head("/api/v2/articles/123"), False, True),
+            (self.rf.get("/api/v2/articles"), True, False),
+            (self.rf.post("/api/v2/articles/123/fragments/foo"), False, False),
+            (self.rf.get("/admin/"), False, False),
+        ]
+        for request, authenticated, expected in cases:
+            actual = self.reads_from_replica(request, authenticated)
+            self.assertEqual(actual, expected, request)
+        self.assertFalse(routers.reading_from_replica())
+
+
+class ConnectionPool(TestCase):
+    def setUp(self):
+        params = connection.get_connection_params()
+        self.connect = lambda: psycopg2.connect(**params)
+        self.opened = []
+
+    def tearDown(self):
+        for conn in self.opened:
+            conn.close()
+
+    def pool(self, **options):
+        return pooled.Pool(**options)
+
+    def get(self, pool):
+        conn = pool.get(self.connect)
+        self.opened.append(conn)
+        return conn
+
+    def terminate(self, conn):
+        "closes `conn` from the server side"
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [conn.info.backend_pid])
+
+    def test_connections_reused(self):
+        pool = self.pool()
+        conn = self.get(pool)
+        pool.put(conn)
+        self.assertIs(self.get(pool), conn)
+        self.assertEqual(pool.stats(), {"size": 1, "idle": 0})
+
+    def test_pool_exhausted(self):
+        "a connection can't be had once all connections are in use"
+        pool = self.pool(MAX_SIZE=1, TIMEOUT=0.1)
+        self.get(pool)
+        self.assertRaises(pooled.PoolTimeout, self.get, pool)
+
+    def test_transaction_rolled_back(self):
+        "connections aren't left idle in a transaction"
+        pool = self.pool()
+        conn = self.get(pool)
+        conn.cursor().execute("SELECT 1")
+        pool.put(conn)
+        self.assertEqual(
+            conn.info.transaction_status, extensions.TRANSACTION_STATUS_IDLE
+        )
+
+    def test_unusable_connections_discarded(self):
+        "idle connections that have expired or been closed are replaced"
+        for options, breaker in [
+            ({"IDLE_TIMEOUT": -1}, lambda conn: None),
+            ({}, lambda conn: conn.close()),
+            ({"HEALTH_CHECK_INTERVAL": -1}, self.terminate),
+        ]:
+            pool = self.pool(**options)
+            conn = self.get(pool)
+            pool.put(conn)
+            breaker(conn)
+            self.assertIsNot(self.get(pool), conn)
+            self.assertEqual(pool.stats(), {"size": 1, "idle": 0})
+
+    def test_expired_connections_swept(self):
+        "every idle connection that has expired is closed, not just the one next in line"
+        pool = self.pool(IDLE_TIMEOUT=0.2)
+        old_conn1, old_conn2, conn = self.get(pool), self.get(pool), self.get(pool)
+        pool.put(old_conn1)
+        pool.put(old_conn2)
+        time.sleep(0.3)
+        pool.put(conn)
+        self.assertTrue(old_conn1.closed)
+        self.assertTrue(old_conn2.closed)
+        self.assertEqual(pool.stats(), {"size": 1, "idle": 1})
+
+    def wrapper(self, alias, **settings_dict):
+        settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": "core.pooled_postgresql",
+            **settings_dict,
+        }
+        self.addCleanup(pooled.POOLS.clear)
+        return pooled.DatabaseWrapper(settings_dict, alias=alias)
+
+    def test_warm_up_unreachable(self):
+        "failing to connect while warming up is a django `DatabaseError` and is only logged"
+        wrapper = self.wrapper("pool-test", HOST="127.0.0.1", PORT="1")
+        self.assertRaises(DatabaseError, wrapper.warm_up)
+        self.assertEqual(wrapper.pool().stats(), {"size": 0, "idle": 0})
+        with patch("publisher.logic.connections", Mock(all=lambda: [wrapper])):
+            with self.assertLogs("publisher.logic", "ERROR"):
+                logic.warm_up()
+
+    def test_backend(self):
+        "warmed up connections that are health checked can be used by django"
+        wrapper = self.wrapper(
+            "pool-test", POOL={"MIN_SIZE": 2, "HEALTH_CHECK_INTERVAL": 0}
+        )
+        pool = wrapper.pool()
+        wrapper.warm_up(lambda cursor: cursor.execute("SELECT 1"))
+        self.assertEqual(pool.stats(), {"size": 2, "idle": 2})
+        self.opened.extend(conn for conn, _ in pool.idle)
+
+        # a request
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), (1,))
+        self.assertTrue(wrapper.get_autocommit())
+        self.assertEqual(pool.stats(), {"size": 2, "idle": 1})
+
+        # the connection is returned to the pool when django closes it
+        wrapper.close()
+        self.assertEqual(pool.stats(), {"size": 2, "idle": 2})
+
+
+class ServerTiming(TestCase):
+    def setUp(self):
+        self.c = Client()
+        self.url = reverse("v2:article-list")
+
+    def timings(self, resp):
+        "returns a map of metric names and their parameters from the 'Server-Timing' header"
+        metrics = [
+            metric.strip().split(";") for metric in resp["Server-Timing"].split(",")
+        ]
+        return {metric[0]: metric[1:] for metric in metrics}
+
+    def test_disabled(self):
+        self.assertFalse(self.c.get(self.url).has_header("Server-Timing"))
+
+    @override_settings(REQUEST_TIMING=True)
+    def test_server_timing(self):
+        "timings for the database, serialisation, view, middleware and whole request are returned"
+        resp = self.c.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        timings = self.timings(resp)
+        for name in ["db", "serialize", "view", "middleware", "total"]:
+            self.assertIn(name, timings)
+            self.assertTrue(timings[name][0].startswith("dur="))
+        self.assertRegex(timings["db"][1], r'desc="\d+ queries"')
+
+    def test_profiled(self):
+        "a cProfile dump is written for the sampled fraction of requests"
+        with tempfile.TemporaryDirectory() as tempdir:
+            with override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_DIR=tempdir):
+                resp = self.c.get(self.url)
+            self.assertFalse(resp.has_header("Server-Timing"))
+            (fname,) = os.listdir(tempdir)
+            pstats.Stats(os.path.join(tempdir, fname))
@@ -0,0 +1,83 @@
+"""timings for the request being handled, see `core.middleware.ServerTiming`.
+
+timings are only recorded while `recording` is in effect, otherwise `timed` does nothing."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+from time import perf_counter
+
+_state = threading.local()
+
+
+class Timings:
+    def __init__(self):
+        # name => seconds
+        self.durations = OrderedDict()
+        self.queries = 0
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    def milliseconds(self):
+        """returns a map of each timing in milliseconds.
+        'middleware' is the time spent outside of the view, if the view was timed."""
+        ms = OrderedDict(
+            (name, round(seconds * 1000, 2)) for name, seconds in self.durations.items()
+        )
+        if "view" in ms and "total" in ms:
+            ms["middleware"] = round(ms["total"] - ms["view"], 2)
+        return ms
+
+    def header(self):
+        "returns the timings as the value of a 'Server-Timing' header"
+        metrics = []
+        for name, ms in self.milliseconds().items():
+            metric = "%s;dur=%s" % (name, ms)
+            if name == "db":
+                metric += ';desc="%s queries"' % self.queries
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+    def log_fields(self):
+        "returns the timings as a map of fields for structured logging"
+        fields = {"%s_ms" % name: ms for name, ms in self.milliseconds().items()}
+        fields["db_queries"] = self.queries
+        return fields
+
+
+def current():
+    "returns the `Timings` being recorded or `None`."
+    return getattr(_state, "timings", None)
+
+
+@contextmanager
+def recording():
+    _state.timings = Timings()
+    try:
+        yield _state.timings
+    finally:
+        _state.timings = None
+
+
+@contextmanager
+def timed(name):
+    "adds the time spent within this context to the named timing"
+    timings = current()
+    if timings is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    "a database 'execute wrapper' that times each query"
+    timings = current()
+    if timings is not None:
+        timings.queries += 1
+    with timed("db"):
+        return execute(sql, params, many, context)
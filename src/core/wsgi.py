@@ -14,3 +14,19 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 from django.core.wsgi import get_wsgi_application
 
 application = get_wsgi_application()
+
+# open and prime database connections before the first request rather than during it
+from publisher import logic  # noqa: E402
+
+try:
+    import uwsgi
+    from uwsgidecorators import postfork
+except ImportError:
+    uwsgi = None
+
+if uwsgi and not (uwsgi.opt.get("lazy-apps") or uwsgi.opt.get("lazy")):
+    # the application is loaded in the uwsgi master process before its workers are forked.
+    # connections opened now would be inherited and shared by every worker.
+    postfork(logic.warm_up)
+else:
+    logic.warm_up()
@@ -1,6 +1,8 @@
+from functools import partial
+from django.db import transaction
 from django.db.models import Count
 from django.contrib import admin
-from . import models, aws_events, fragment_logic
+from . import models, aws_events, fragment_logic, logic, response_cache
 
 
 class ArticleVersionAdmin(admin.TabularInline):
@@ -68,13 +70,21 @@ class ArticleAdmin(admin.ModelAdmin):
         # simpler to disable hash check when updating many articles
         fragment_logic.set_all_article_json(art, quiet=True, hash_check=False)
         aws_events.notify(art.manuscript_id)
+        transaction.on_commit(partial(response_cache.evict, art.manuscript_id))
 
     def save_related(self, request, form, formsets, change):
         super(ArticleAdmin, self).save_related(request, form, formsets, change)
         art = form.instance
+        # publication dates may have been changed
+        logic.update_latest_versions(art)
         # simpler to disable hash check when updating many articles
         fragment_logic.set_all_article_json(art, quiet=True, hash_check=False)
+        logic.update_history(art)
         aws_events.notify(art.manuscript_id)
+        transaction.on_commit(partial(response_cache.evict, art.manuscript_id))
+        # related articles embed snippets of this article's versions
+        for av in art.articleversion_set.all():
+            transaction.on_commit(partial(response_cache.evict_all, av))
 
 
 admin_list = [(models.Publisher,), (models.Journal,), (models.Article, ArticleAdmin)]
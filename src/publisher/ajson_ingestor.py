@@ -3,6 +3,7 @@ see `events.py` for converting article-json into ArticleEvent data."""
 
 import json
 import copy
+from core import metrics
 from publisher import (
     models,
     utils,
@@ -10,6 +11,7 @@ from publisher import (
     logic,
     events,
     aws_events,
+    response_cache,
 )
 from publisher import relation_logic as relationships, codes
 from publisher.models import XML2JSON
@@ -18,7 +20,7 @@ import logging
 from django.db import transaction
 from et3 import render
 from et3.extract import path as p
-from functools import partial
+from functools import partial, wraps
 from jsonschema import ValidationError
 
 LOG = logging.getLogger(__name__)
@@ -60,20 +62,47 @@ REVIEWED_PREPRINT = {
 #
 
 
+def measured(action):
+    "counts the outcome of `action` by error code and observes its latency for `/metrics`."
+
+    def wrap(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            outcome = codes.UNKNOWN
+            try:
+                with metrics.INGEST_LATENCY.time(action=action):
+                    result = fn(*args, **kwargs)
+                outcome = "success"
+                return result
+            except fragments.Identical:
+                outcome = "identical"
+                raise
+            except StateError as err:
+                outcome = err.code
+                raise
+            finally:
+                metrics.INGEST.inc(action=action, outcome=outcome)
+
+        return wrapper
+
+    return wrap
+
+
 def _ingest_objects(data, create, update, force, log_context):
     "INGEST event helper. returns the journal, article, an article version and a list of article events"
 
     # WARN: log_context is a mutable dict
 
-    # et3 won't mutate data but there may be a function in the pipeline that does. this is safest.
-    data = copy.deepcopy(data)
-
     # this *could* be scraped from the provided data, but we have no time to
     # normalize journal names so we sometimes get duplicate journals in the db.
     # safer to disable until needed.
     journal = logic.journal()
 
     try:
+        # et3 won't mutate data but `events.ajson_ingest_events` adds a 'forced?' key to the article.
+        # nothing nested is modified so there is no need to copy all of it.
+        data = dict(data, article=copy.copy(data["article"]))
+
         article_struct = render.render_item(ARTICLE, data["article"])
         unique_key_list = ["manuscript_id", "journal"]
         article, created, updated = create_or_update(
@@ -236,9 +265,12 @@ def _ingest(data, force=False) -> models.ArticleVersion:
         # passed all checks, save
         # lsh@2023-09-19: save again? this could be unnecessary
         av.save()
+        logic.update_latest_versions(av.article)
+        logic.update_history(av.article)
 
         # notify event bus that article change has occurred
         transaction.on_commit(partial(aws_events.notify_all, av))
+        transaction.on_commit(partial(response_cache.evict_all, av))
 
         return av
 
@@ -265,6 +297,8 @@ def _ingest(data, force=False) -> models.ArticleVersion:
         raise
 
 
+@measured("ingest")
+@fragments.writes_valid
 @atomic
 def ingest(*args, **kwargs) -> models.ArticleVersion:
     return _ingest(*args, **kwargs)
@@ -333,6 +367,7 @@ def _publish(msid, version, force=False) -> models.ArticleVersion:
 
         av.datetime_published = datetime_published
         av.save()
+        logic.update_latest_versions(av.article)
 
         events.ajson_publish_events(av, force)
 
@@ -341,9 +376,11 @@ def _publish(msid, version, force=False) -> models.ArticleVersion:
         # NOTE: hash checks will always fail on publish events as we modify the `versionDate`.
         quiet = force
         fragments.set_article_json(av, data=None, quiet=quiet, hash_check=False)
+        logic.update_history(av.article)
 
         # notify event bus that article change has occurred
         transaction.on_commit(partial(aws_events.notify_all, av))
+        transaction.on_commit(partial(response_cache.evict_all, av))
 
         return av
 
@@ -371,6 +408,8 @@ def _publish(msid, version, force=False) -> models.ArticleVersion:
         )
 
 
+@measured("publish")
+@fragments.writes_valid
 @atomic
 def publish(*args, **kwargs) -> models.ArticleVersion:
     return _publish(*args, **kwargs)
@@ -381,6 +420,8 @@ def publish(*args, **kwargs) -> models.ArticleVersion:
 #
 
 
+@measured("ingest-publish")
+@fragments.writes_valid
 @atomic
 def ingest_publish(data, force=False, dry_run=False) -> models.ArticleVersion:
     "convenience. publish an article if it were successfully ingested"
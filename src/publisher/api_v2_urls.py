@@ -25,6 +25,7 @@ urlpatterns = (
             name="article-relations",
         ),
         # not part of Public API
+        re_path(r"^articles/export$", views.article_export, name="article-export"),
         # why the odd fragment regex? to support models.XML2JSON 'xml->json' fragment ID
         # simplifying it to alpha-numeric + hyphen may remove a class of problems
         re_path(
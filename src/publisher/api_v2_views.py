@@ -1,71 +1,36 @@
-import cProfile, pstats
+import base64
+from collections import namedtuple
+import re
+from datetime import datetime
+from functools import lru_cache, wraps
 import json
 import jsonschema
 from django.core import exceptions as django_errors
-from . import models, logic, fragment_logic, utils
+from core import timing
+from . import models, logic, fragment_logic, utils, response_cache
 from .utils import ensure, isint, toint, lmap
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 from django.conf import settings
-from django.http import HttpResponse as DjangoHttpResponse
+from django.http import (
+    HttpResponse as DjangoHttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.cache import parse_etags, patch_vary_headers
 from django.core.exceptions import ObjectDoesNotExist
 from .models import XML2JSON
 from et3.extract import path as p
 from et3.render import render_item
 import logging
 from django.http.multipartparser import parse_header
-import django.db.transaction
 
 
 LOG = logging.getLogger(__name__)
 
-PROFILING = False
-
-
-# see also: logic.qdebug
-def profile(fn):
-    "prints profiling stats using cProfile when used a view decorator."
-
-    if not PROFILING:
-        return fn
-
-    def wrapper(*args, **kwargs):
-        db_conn = django.db.transaction.get_connection()
-
-        pr = cProfile.Profile(timeunit=0.001)
-        pr.enable()
-        result = fn(*args, **kwargs)
-        pr.disable()
-
-        for i, query in enumerate(db_conn.queries):
-            print()
-            print(
-                "query %s (%s ms): %s"
-                % (i + 1, float(query["time"]) * 1000, query["sql"])
-            )
-            print()
-
-        print(
-            "%s database queries (%s ms)"
-            % (
-                len(db_conn.queries),
-                round(sum(float(q["time"]) for q in db_conn.queries) * 1000, 4),
-            )
-        )
-
-        print()
-
-        sortby = "cumulative"
-        ps = pstats.Stats(pr).sort_stats(sortby)
-        ps.print_stats(0.03)
-        fname = "/tmp/output-%s.prof" % fn.__name__
-        ps.dump_stats(fname)
-        print("wrote", fname)
-
-        return result
-
-    return wrapper
+# same as `django.middleware.gzip`
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
 
 
 class HttpResponse(DjangoHttpResponse):
@@ -106,7 +71,8 @@ def json_response(data, code=200, content_type=None, headers=None):
     "dumps given `data` to json and sets a sensible default content-type header."
     content_type = content_type or "application/json"
     headers = headers or {}
-    json_string = utils.json_dumps(data)
+    with timing.timed("serialize"):
+        json_string = utils.json_dumps(data)
     return response(json_string, code, content_type, headers)
 
 
@@ -129,6 +95,34 @@ def http_404(detail=None):
     return error_response(404, "not found", detail)
 
 
+def encode_cursor(av):
+    "returns an opaque cursor for the position of the given article version in an article list"
+    dt = av.datetime_published
+    pair = [dt.isoformat() if dt else None, av.article.manuscript_id]
+    return base64.urlsafe_b64encode(json.dumps(pair).encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor):
+    "returns the `(datetime_published, msid)` pair encoded in the given `cursor`"
+    try:
+        dt, msid = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        ensure(isint(msid), "bad msid")
+        return (datetime.fromisoformat(dt) if dt else None, int(msid))
+    except (ValueError, TypeError, AssertionError):
+        raise utils.LaxAssertionError("unrecognised value for 'cursor' parameter")
+
+
+def next_page_link(request, results, per_page):
+    """returns a `Link` header value pointing to the page of results following `results`.
+    returns `None` if `results` is the last page."""
+    if len(results) < per_page:
+        return None
+    params = request.GET.copy()
+    params.pop("page", None)
+    params["cursor"] = encode_cursor(results[-1])
+    return '<%s?%s>; rel="next"' % (request.path, params.urlencode())
+
+
 def request_args(request, **overrides):
     opts = {}
     opts.update(settings.API_OPTS)
@@ -163,7 +157,31 @@ def request_args(request, **overrides):
         )
         return v
 
+    def ascursor(val):
+        if val is None:
+            return None
+        ensure("page" not in request.GET, "'cursor' and 'page' cannot be used together")
+        return decode_cursor(val)
+
+    def asmsidlist(val):
+        if val is None:
+            return None
+        msid_list = [v.strip() for v in val.split(",")]
+        ensure(
+            all(isint(v) and int(v) > 0 for v in msid_list),
+            "expecting a comma separated list of article IDs for 'id' parameter",
+        )
+        ensure(
+            len(msid_list) <= opts["max_per_page"],
+            "no more than %s article IDs may be given for 'id' parameter"
+            % opts["max_per_page"],
+        )
+        # duplicates removed, order preserved
+        return list(dict.fromkeys(int(v) for v in msid_list))
+
     desc = {
+        "id": [p("id", None), asmsidlist],
+        "cursor": [p("cursor", None), ascursor],
         "page": [p("page", opts["page_num"]), ispositiveint("page")],
         "per_page": [
             p("per-page", opts["per_page"]),
@@ -234,6 +252,127 @@ def negotiate(accepts_header_str, content_type_key):
     return (response_mime, max(versions))
 
 
+#
+# content negotiation
+# see `middleware.negotiate_content`
+#
+
+
+def get_content_type(resp):
+    # `resp.content_type` would also work, *however* we can't guarantee
+    # every HttpResponse object will subclass our custom response.
+    return resp.get("Content-Type")
+
+
+# deprecated content-types are simply the oldest ones
+
+# a list of triples like `(mime, 'version', version)`
+# see `flatten_accept`
+DEPRECATED_CONTENT_TYPES = []
+for tpe, rows in settings.ALL_SCHEMA_IDX.items():
+    if len(rows) > 1:
+        for deprecated_version, _ in rows[1:]:
+            # stringify version because that is what `flatten_accept` returns
+            deprecated = (_ctype(tpe), "version", str(deprecated_version))
+            DEPRECATED_CONTENT_TYPES.append(deprecated)
+
+
+# the result of parsing an 'Accept' header.
+# `accepts` is a tuple of triples like `(mime, 'version', version)`, see `flatten_accept`.
+# `max_versions` maps a mime to the highest specific version requested for it.
+# `versions` maps each content type key to the version it will be served as, or `None` if it can't be.
+Negotiation = namedtuple(
+    "Negotiation", ["accepts", "deprecated", "max_versions", "versions"]
+)
+
+
+@lru_cache(maxsize=256)
+def parse_accept(accepts_header_str):
+    """parses the given 'Accept' header string into a `Negotiation`.
+    memoized, there are only a handful of distinct 'Accept' headers in practice."""
+    accepts = tuple(flatten_accept(accepts_header_str))
+    requested = {}
+    for mime, _, version in accepts:
+        if isint(version):
+            requested.setdefault(mime, []).append(int(version))
+    content_type_versions = {}
+    for content_type_key in settings.CONTENT_TYPES:
+        negotiated = negotiate(accepts_header_str, content_type_key)
+        content_type_versions[content_type_key] = negotiated[1] if negotiated else None
+    return Negotiation(
+        accepts=accepts,
+        deprecated=any(target in accepts for target in DEPRECATED_CONTENT_TYPES),
+        max_versions={mime: max(versions) for mime, versions in requested.items()},
+        versions=content_type_versions,
+    )
+
+
+def downgrade(negotiation, response):
+    """when a POA/VOR content-type version less than the current version is requested,
+    downgrades the content-type of the successful `response` if possible or returns a 406.
+    """
+    response_ctype = get_content_type(response) or ""
+    for (
+        content_type_key,
+        valid_under_previous_version,
+    ) in fragment_logic.PREVIOUS_VERSION_CHECKS.items():
+        mime = _ctype(content_type_key)
+        if mime not in response_ctype:
+            continue
+
+        max_accepted = negotiation.max_versions.get(mime)
+        if max_accepted is None:
+            # no specific version specified, return latest version
+            return response
+
+        current_version = settings.ALL_SCHEMA_IDX[content_type_key][0][0]
+        previous_version = settings.ALL_SCHEMA_IDX[content_type_key][1][0]
+
+        if max_accepted == current_version:
+            # user requested the current latest version
+            return response
+
+        if max_accepted == previous_version:
+            # client specifically accepts an older version only (deprecated).
+            # we might be ok if the content is valid under the previous version.
+            # see `fragment_logic.content_type_versions`.
+            compatible = getattr(response, "content_type_versions", None)
+            if compatible is None:
+                # not known for this response, check the content itself
+                body = json.loads(response.content.decode("utf-8"))
+                valid = valid_under_previous_version(body)
+            else:
+                valid = previous_version in compatible
+            if valid:
+                response["Content-Type"] = "%s; version=%s" % (mime, previous_version)
+                return response
+
+        # an unsupported version was requested
+        return http_406()
+
+    return response
+
+
+def acceptable(negotiation, response):
+    "returns `True` if the content-type of the successful `response` is accepted by the client."
+    response_ctype = get_content_type(response) or "*/*"
+
+    # response accept header will always be a list with a single row
+    response_mime = parse_accept(response_ctype).accepts[0]
+    response_mime_general_case = response_mime[:2] + (None,)
+
+    anything = ("*/*", "version", None)
+    almost_anything = ("application/*", "version", None)
+
+    client_accepts_list = negotiation.accepts
+    return (
+        response_mime in client_accepts_list
+        or response_mime_general_case in client_accepts_list
+        or anything in client_accepts_list
+        or almost_anything in client_accepts_list
+    )
+
+
 #
 #
 #
@@ -245,6 +384,146 @@ def is_authenticated(request):
     return val or False
 
 
+#
+# conditional requests
+#
+
+
+def etag(av, content_type_version, gzipped=False):
+    """returns a strong ETag for the article-json of the given `av` served as the given `content_type_version`.
+    gzip encoded article-json has a different ETag. returns `None` if `av` has no article-json hash.
+    """
+    if not av.article_json_hash:
+        return None
+    suffix = "-gzip" if gzipped else ""
+    return '"%s-v%s%s"' % (av.article_json_hash, content_type_version, suffix)
+
+
+def accepts_gzip(request):
+    "returns `True` if the client accepts gzip encoded responses."
+    return bool(ACCEPTS_GZIP.search(request.META.get("HTTP_ACCEPT_ENCODING", "")))
+
+
+def not_modified(request, etag_str):
+    "returns `True` if the 'If-None-Match' header in the request matches the given `etag_str`."
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header or not etag_str:
+        return False
+    # weak comparison: https://datatracker.ietf.org/doc/html/rfc7232#section-3.2
+    # downstream proxies that compress responses will weaken strong etags.
+    etag_list = [e[2:] if e.startswith("W/") else e for e in parse_etags(header)]
+    return "*" in etag_list or etag_str in etag_list
+
+
+def negotiable(request, content_type, content_type_versions):
+    """returns `True` if a successful response with the given `content_type` would be served by the
+    `negotiate_content` middleware rather than replaced with a 406.
+    a 304 is only sent for content the client would otherwise be sent."""
+    resp = HttpResponse(content_type=content_type)
+    # without the compatible versions, a previous version can only be checked against the body
+    resp.content_type_versions = content_type_versions or []
+    resp = downgrade(request.negotiation, resp)
+    return resp.status_code == 200 and acceptable(request.negotiation, resp)
+
+
+#
+# response caching
+#
+
+
+def cached_response(view):
+    """caches successful responses from the given article view in the `response_cache`.
+    responses are keyed by the view's arguments, the 'Accept' header, gzip support and authentication.
+    """
+
+    @wraps(view)
+    def wrapper(request, msid, **kwargs):
+        if not response_cache.enabled():
+            return view(request, msid, **kwargs)
+        cache_key = response_cache.key(
+            msid,
+            view.__name__,
+            tuple(sorted(kwargs.items())),
+            request.META.get("HTTP_ACCEPT"),
+            accepts_gzip(request),
+            bool(is_authenticated(request)),
+        )
+        hit = response_cache.get(cache_key)
+        if hit:
+            content, headers, content_type_versions = hit
+            if negotiable(
+                request, headers.get("Content-Type"), content_type_versions
+            ) and not_modified(request, headers.get("ETag")):
+                resp = HttpResponseNotModified()
+                resp["ETag"] = headers["ETag"]
+                patch_vary_headers(resp, ["Accept-Encoding"])
+                return resp
+            resp = response(content, headers=headers)
+            resp.content_type_versions = content_type_versions
+            return resp
+        resp = view(request, msid, **kwargs)
+        # HEAD responses have no body
+        if resp.status_code == 200 and request.method == "GET":
+            content_type_versions = getattr(resp, "content_type_versions", None)
+            value = (resp.content, dict(resp.items()), content_type_versions)
+            response_cache.put(cache_key, value)
+        return resp
+
+    return wrapper
+
+
+def article_response(request, av):
+    """returns the article-json for the given `av` or a HTTP 304 if the client's copy is current.
+    the stored article-json is returned as-is without being deserialised and serialised again.
+    the stored gzip encoding is returned if the client accepts it.
+    HEAD requests are answered using the stored sizes without loading the article-json.
+    """
+    content_type = ctype(av.status)
+    # a version we can't negotiate is handled by the `negotiate_content` middleware.
+    content_type_version = (
+        request.negotiation.versions[av.status]
+        or settings.SCHEMA_VERSIONS[av.status][0]
+    )
+    # the `negotiate_content` middleware can't parse a compressed body to downgrade it
+    gzipped = accepts_gzip(request) and av.content_type_versions is not None
+    etag_str = etag(av, content_type_version, gzipped)
+    headers = {"ETag": etag_str} if etag_str else {}
+    if negotiable(request, content_type, av.content_type_versions) and not_modified(
+        request, etag_str
+    ):
+        resp = HttpResponseNotModified()
+        resp["ETag"] = etag_str
+        patch_vary_headers(resp, ["Accept-Encoding"])
+        return resp
+    length = av.article_json_v1_gzip_length if gzipped else av.article_json_v1_length
+    # the `negotiate_content` middleware can't downgrade an empty body without `content_type_versions`
+    head = (
+        request.method == "HEAD"
+        and length is not None
+        and av.content_type_versions is not None
+    )
+    if head:
+        # the article-json isn't loaded, the body is never sent
+        content = b""
+        headers["Content-Length"] = str(length)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+    else:
+        content = logic.article_json_gzip(av) if gzipped else None
+        if content is not None:
+            headers["Content-Encoding"] = "gzip"
+        else:
+            content = logic.article_json_text(av)
+            if gzipped and etag_str:
+                # article-json stored before gzip encodings were
+                headers["ETag"] = etag(av, content_type_version)
+    resp = response(content, content_type=content_type, headers=headers)
+    patch_vary_headers(resp, ["Accept-Encoding"])
+    # lets the `negotiate_content` middleware downgrade the content-type without parsing the body
+    resp.content_type_versions = av.content_type_versions
+    return resp
+
+
 @require_http_methods(["HEAD", "GET"])
 def article_list(request):
     "returns a list of snippets"
@@ -252,85 +531,94 @@ def article_list(request):
     try:
         kwargs = request_args(request)
         kwargs["only_published"] = not authenticated
+        msid_list = kwargs.pop("id")
+        if msid_list:
+            # a batch of specific articles, ignores pagination
+            results = logic.latest_article_versions(
+                msid_list, only_published=not authenticated
+            )
+            data = {
+                "total": len(results),
+                "items": lmap(logic.article_snippet_json, results),
+            }
+            return json_response(data, content_type=ctype(settings.LIST))
         total, results = logic.latest_article_version_list(**kwargs)
         data = {"total": total, "items": lmap(logic.article_snippet_json, results)}
-        return json_response(data, content_type=ctype(settings.LIST))
+        headers = {}
+        link = next_page_link(request, results, kwargs["per_page"])
+        if link:
+            headers["Link"] = link
+        return json_response(data, content_type=ctype(settings.LIST), headers=headers)
     except AssertionError as err:
         return error_response(400, "bad request", err.message)
 
 
 @require_http_methods(["HEAD", "GET"])
+@cached_response
 def article(request, msid):
     "return the article-json for the most recent version of the given article ID"
     authenticated = is_authenticated(request)
     try:
-        av = logic.most_recent_article_version(msid, only_published=not authenticated)
-        return json_response(logic.article_json(av), content_type=ctype(av.status))
+        # the article-json is fetched separately, as text, only if it needs to be sent
+        av = logic.most_recent_article_version(
+            msid, only_published=not authenticated, defer=True
+        )
+        return article_response(request, av)
     except models.Article.DoesNotExist:
         return http_404()
 
 
-def article_version_list__v1(request, msid):
-    "returns a list of versions for the given article ID"
+@require_http_methods(["HEAD", "GET"])
+@cached_response
+def article_version_list(request, msid):
+    """returns a list of versions for the given article ID.
+    version 2 of the history also includes preprint events."""
     authenticated = is_authenticated(request)
+    content_type_version = request.negotiation.versions[settings.HISTORY]
+    if not content_type_version:
+        return http_406()
     try:
-        data = logic.article_version_history__v1(msid, only_published=not authenticated)
-        return json_response(data, content_type=ctype(settings.HISTORY, 1))
+        data = logic.article_version_history_json(
+            msid, content_type_version, only_published=not authenticated
+        )
+        return response(
+            data, content_type=ctype(settings.HISTORY, content_type_version)
+        )
     except models.Article.DoesNotExist:
         return http_404()
 
 
-def article_version_list__v2(request, msid):
-    "returns a list of versions for the given article ID, including preprint events."
-    authenticated = is_authenticated(request)
-    data = logic.article_version_history__v2(msid, only_published=not authenticated)
-    if not data:
-        return http_404()
-    return json_response(data, content_type=ctype(settings.HISTORY))
-
-
-@require_http_methods(["HEAD", "GET"])
-def article_version_list(request, msid):
-    "returns a list of versions for the given article ID"
-    accepts_header_str = request.META.get("HTTP_ACCEPT")
-    content_type = negotiate(accepts_header_str, settings.HISTORY)
-    if not content_type:
-        return http_406()
-    content_type, content_type_version = content_type
-    if content_type_version == 2:
-        return article_version_list__v2(request, msid)
-    return article_version_list__v1(request, msid)
-
-
 @require_http_methods(["HEAD", "GET"])
+@cached_response
 def article_version(request, msid, version):
     "returns the article-json for a specific version of the given article ID"
     authenticated = is_authenticated(request)
     try:
         # TODO: test at the HTTP level also the other requests
-        av = logic.article_version(msid, version, only_published=not authenticated)
-        return json_response(logic.article_json(av), content_type=ctype(av.status))
+        av = logic.article_version(
+            msid, version, only_published=not authenticated, defer=True
+        )
+        return article_response(request, av)
     except models.ArticleVersion.DoesNotExist:
         return http_404()
 
 
 @require_http_methods(["HEAD", "GET"])
+@cached_response
 def article_related(request, msid):
     "return the related articles for a given article ID"
     authenticated = is_authenticated(request)
     try:
-        accepts_header_str = request.META.get("HTTP_ACCEPT")
-        content_type = negotiate(accepts_header_str, settings.RELATED)
-        if not content_type:
+        content_type_version = request.negotiation.versions[settings.RELATED]
+        if not content_type_version:
             return http_406()
-        content_type, content_type_version = content_type
         only_published = not authenticated
         include_rpp = content_type_version == 2
         # lsh@2022-05-11: disabled, replaced with raw SQL for better, fixed, performance.
         # - https://github.com/elifesciences/issues/issues/7290
         # rl = logic.relationships(msid, only_published=not authenticated)
-        rl = logic.relationships2(msid, only_published, include_rpp)
-        return json_response(
+        rl = logic.relationships_json(msid, only_published, include_rpp)
+        return response(
             rl, content_type=ctype(settings.RELATED, version=content_type_version)
         )
 
@@ -338,6 +626,38 @@ def article_related(request, msid):
         return http_404()
 
 
+#
+# Export
+# not part of public api
+#
+
+
+@require_http_methods(["HEAD", "GET"])
+def article_export(request):
+    """streams the snippet, or the article-json with `?content=article-json`, of the most recent
+    version of every article as newline delimited json. gzip compressed if the client accepts it.
+    """
+    authenticated = is_authenticated(request)
+    content = request.GET.get("content", "snippet")
+    if content not in ["snippet", "article-json"]:
+        return error_response(
+            400,
+            "bad request",
+            "expecting either 'snippet' or 'article-json' for 'content' parameter",
+        )
+    body = logic.export_article_versions(
+        only_published=not authenticated, article_json=content == "article-json"
+    )
+    gzipped = accepts_gzip(request)
+    if gzipped:
+        body = utils.gzip_stream(body)
+    resp = StreamingHttpResponse(body, content_type="application/x-ndjson")
+    if gzipped:
+        resp["Content-Encoding"] = "gzip"
+    patch_vary_headers(resp, ["Accept-Encoding"])
+    return resp
+
+
 #
 # Fragments
 # not part of public api
@@ -3,6 +3,7 @@ from ordered_set import OrderedSet
 import json
 from django.conf import settings
 import boto3
+from core import metrics
 from publisher import relation_logic as relationships
 from functools import wraps
 import queue
@@ -105,7 +106,8 @@ def notify(msid):
         msg = {"type": "article", "id": msid}
         msg_json = json.dumps(msg)
         LOG.debug("writing message to event bus", extra={"bus-message": msg_json})
-        event_bus_conn().publish(Message=msg_json)
+        with metrics.NOTIFY_LATENCY.time():
+            event_bus_conn().publish(Message=msg_json)
         return msg_json  # used only for testing
 
     except ValueError as err:
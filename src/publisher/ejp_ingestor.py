@@ -1,6 +1,7 @@
 import json
+from functools import partial
 from dateutil import parser
-from . import models, utils, events
+from . import models, logic, utils, events, response_cache
 from django.db import transaction
 
 import logging
@@ -23,6 +24,9 @@ def import_article(journal, article_data, create=True, update=False):
         # no point creating events if nothing to be preserved
         if create or update:
             events.ejp_ingest_events(art, article_data)
+            # received and accepted dates may have changed
+            logic.update_history(art)
+            transaction.on_commit(partial(response_cache.evict, art.manuscript_id))
 
         return art, created, updated
 
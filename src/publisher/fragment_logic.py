@@ -1,10 +1,13 @@
 import copy
+import gzip
 import hashlib
-from functools import partial
+from functools import partial, wraps
+import threading
 from jsonschema import ValidationError
 from django.db.models import Q
 from django.conf import settings
-from . import utils, models, aws_events, codes
+from core import metrics
+from . import utils, models, logic, aws_events, codes, response_cache
 from .utils import create_or_update, ensure, subdict, StateError, lmap
 import logging
 from django.db import transaction
@@ -32,7 +35,13 @@ def add(x, ftype, fragment, pos=1, update=False):
     # if ftype != models.XML2JSON:
     #    verboten_keys = ['published', 'versionDate']
     #    ensure(not subdict(fragment, verboten_keys), "fragment contains illegal keys. illegal keys: %s" % (", ".join(verboten_keys),))
-    data = {"version": None, "type": ftype, "fragment": fragment, "position": pos}
+    data = {
+        "version": None,
+        "type": ftype,
+        "fragment": fragment,
+        "fragment_hash": hash_ajson(fragment),
+        "position": pos,
+    }
     data.update(_getids(x))
     key = ["article", "type", "version"]
     frag, created, updated = create_or_update(
@@ -54,18 +63,104 @@ def get(x, ftype):
     return models.ArticleFragment.objects.get(**kwargs)
 
 
-def merge(av):
-    """returns the merged result for a particlar article version"""
+def _fragments(av):
+    "returns the fragments merged for a particular article version, in merge order"
     # all fragments belonging to this specific article version or
     # to this article in general
     query = Q(version=av.version) | Q(version=None)
     if not settings.MERGE_FOREIGN_FRAGMENTS:
         # ((version=av.version OR version=none) AND type=xml->json)
         query &= Q(type=models.XML2JSON)
-    fragments = models.ArticleFragment.objects.filter(article=av.article).filter(query)
+    return models.ArticleFragment.objects.filter(article=av.article).filter(query)
+
+
+def merge(av):
+    """returns the merged result for a particlar article version"""
+    fragments = _fragments(av)
     if not fragments:
         raise StateError(codes.NO_RECORD, "%r has no fragments that can be merged" % av)
-    return utils.merge_all([f.fragment for f in fragments])
+    fragment_list = [f.fragment for f in fragments]
+    with metrics.MERGE_LATENCY.time():
+        return utils.merge_all(fragment_list)
+
+
+# validation results recorded while calling a function decorated with `writes_valid`.
+# `collected` is a set of `(content_hash, schema, schema_hash)` triples, per thread.
+_VALID = threading.local()
+
+
+def _collected():
+    return getattr(_VALID, "collected", None)
+
+
+def validated(content_hash, schema):
+    "returns `True` if article-json with the given `content_hash` has been found valid against `schema` before"
+    key = (content_hash, schema, utils.schema_hash(schema))
+    collected = _collected()
+    hit = (collected is not None and key in collected) or (
+        models.ValidationResult.objects.filter(
+            content_hash=content_hash, schema=schema, schema_hash=key[2]
+        ).exists()
+    )
+    metrics.VALIDATION_CACHE.inc(result="hit" if hit else "miss")
+    return hit
+
+
+def record_valid(content_hash, schema):
+    """records that article-json with the given `content_hash` is valid against `schema`.
+    inside `writes_valid` the result is written once the decorated function returns, even if its
+    transaction was rolled back. an ingest that turns out to be `Identical` is rolled back but it's data was still valid.
+    otherwise the result is written straight away, as part of any transaction."""
+    result = (content_hash, schema, utils.schema_hash(schema))
+    collected = _collected()
+    if collected is not None:
+        collected.add(result)
+    else:
+        write_valid([result])
+
+
+def write_valid(results):
+    "writes the given `(content_hash, schema, schema_hash)` validation results"
+    if not results:
+        return
+    # another process may have recorded it first
+    models.ValidationResult.objects.bulk_create(
+        [
+            models.ValidationResult(
+                content_hash=content_hash, schema=schema, schema_hash=schema_hash
+            )
+            for content_hash, schema, schema_hash in results
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def writes_valid(fn):
+    """calls `fn` and then writes any validation results it recorded, whether or not the
+    transaction it opened was committed. decorates functions that are decorated with `utils.atomic`."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _collected() is not None:
+            # written by the outermost call
+            return fn(*args, **kwargs)
+        _VALID.collected = set()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            collected, _VALID.collected = _VALID.collected, None
+            write_valid(collected)
+
+    return wrapper
+
+
+def prune_validation_results():
+    """deletes validation results for schemas that have since changed or are no longer used.
+    see the `prune_validation_results` command."""
+    current = Q()
+    for schema in settings.SCHEMA_MAP:
+        current |= Q(schema=schema, schema_hash=utils.schema_hash(schema))
+    return models.ValidationResult.objects.exclude(current).delete()[0]
 
 
 def _validate(msid, version, data, schema_key, quiet=True):
@@ -79,12 +174,21 @@ def _validate(msid, version, data, schema_key, quiet=True):
 
     log_context = {"msid": msid, "version": version}
 
+    # the data is normalised and hashed once for all schema versions
+    data = utils.normalise(data)
+    content_hash = utils.canonical_hash(data) if settings.VALIDATION_CACHE else None
+
     validation_errors = []
     schema_versions_list = []
     for schema_version, schema in settings.ALL_SCHEMA_IDX[schema_key]:
         try:
             schema_versions_list.append(schema_version)
-            return utils.validate(data, schema)
+            if content_hash and validated(content_hash, schema):
+                return data
+            data = utils.validate(data, schema)
+            if content_hash:
+                record_valid(content_hash, schema)
+            return data
 
         except KeyError:
             msg = f"merging {msid} returned a data structure that couldn't be used to determine validity."
@@ -122,7 +226,8 @@ def valid(merge_result, quiet=True):
     schema_key = merge_result["status"]  # 'poa' or 'vor'
     msid = merge_result.get("id", "[no id]")
     version = merge_result.get("version", "[no version]")
-    return _validate(msid, version, merge_result, schema_key, quiet)
+    with metrics.VALIDATION_LATENCY.time(schema=schema_key):
+        return _validate(msid, version, merge_result, schema_key, quiet)
 
 
 def valid_snippet(merge_result, quiet=True):
@@ -136,7 +241,8 @@ def valid_snippet(merge_result, quiet=True):
     wrapped_data = {"total": 1, "items": [merge_result]}
     msid = merge_result.get("id", "[no id]")
     version = merge_result.get("version", "[no version]")
-    wrapped_data = _validate(msid, version, wrapped_data, schema_key, quiet)
+    with metrics.VALIDATION_LATENCY.time(schema=schema_key):
+        wrapped_data = _validate(msid, version, wrapped_data, schema_key, quiet)
     if wrapped_data:
         return wrapped_data["items"][0]
 
@@ -178,40 +284,49 @@ def extract_snippet(merged_result):
     return subdict(merged_result, snippet_keys)
 
 
-def pre_process(av, result):
-    "supplements the merged fragments with more article data required for validating"
-    # don't modify what we were given
-    # result = utils.deepcopy_data(result) # passes tests
-    result = copy.deepcopy(result)  # safer
-
-    # we need to inspect this value later in `hashcheck` before it gets nullified
-    result["-published"] = result["published"]
-
+def article_dates(av):
+    "returns the 'published', 'versionDate' and 'statusDate' values of the article-json for `av`"
     # 'published' is when the v1 article was published
     # if unpublished, this value will be None
     if av.version == 1:
-        result["published"] = av.datetime_published
+        published = av.datetime_published
     else:
-        result["published"] = av.article.datetime_published
-
-    result["versionDate"] = av.datetime_published
+        published = av.article.datetime_published
 
     # 'statusDate' is when the 'status' (poa/vor) value changed to the status being
     # served up in *this* result.
     if av.version == 1 or av.status == models.POA:
         # we're a POA or a version 1, statusDate is easy :)
-        result["statusDate"] = result["published"]
+        status_date = published
     else:
         # we're a non-v1 VOR, statusDate is a little harder
         # we can't tell which previous version was a vor so consult our version history
         earliest_vor = av.article.earliest_vor()
         if earliest_vor:
             # article has a vor in it's version history! use it's version date
-            result["statusDate"] = earliest_vor.datetime_published  # may be None
+            status_date = earliest_vor.datetime_published  # may be None
         else:
             # no VORs found AT ALL
             # this means our av == earliest_vor and it *hasn't been saved yet*
-            result["statusDate"] = av.datetime_published  # may be/probably None
+            status_date = av.datetime_published  # may be/probably None
+
+    return {
+        "published": published,
+        "versionDate": av.datetime_published,
+        "statusDate": status_date,
+    }
+
+
+def pre_process(av, result):
+    "supplements the merged fragments with more article data required for validating"
+    # don't modify what we were given.
+    # only top-level keys are changed below, nested values are shared with the merged fragments.
+    result = copy.copy(result)
+
+    # we need to inspect this value later in `hashcheck` before it gets nullified
+    result["-published"] = result["published"]
+
+    result.update(article_dates(av))
 
     if av.datetime_published:
         result["stage"] = "published"
@@ -241,6 +356,40 @@ def hash_ajson(merge_result):
     return hashlib.md5(string.encode("utf-8")).hexdigest()
 
 
+def inputs_hash(av, data=None):
+    """returns a hash of everything the article-json for `av` is derived from or `None` if there is nothing.
+    that is it's fragments in merge order, the values `pre_process` depends on and the schemas it's validated against.
+    `data` is article-json that will replace the xml->json fragment of `av`."""
+    fragment_list = []
+    replaced = False
+    # the fragments themselves are only loaded if they haven't been hashed
+    for frag in _fragments(av).defer("fragment"):
+        row = [frag.type, frag.version, frag.position, frag.fragment_hash]
+        if data and frag.type == models.XML2JSON and frag.version == av.version:
+            # see `set_article_json`
+            row[2:] = [0, hash_ajson(data["article"])]
+            replaced = True
+        fragment_list.append(row if row[3] else row[:3] + [hash_ajson(frag.fragment)])
+
+    if not fragment_list or (data and not replaced):
+        return None
+
+    schema_list = [
+        utils.schema_hash(path)
+        for schema_key in [models.POA, models.VOR, settings.LIST]
+        for _, path in settings.ALL_SCHEMA_IDX[schema_key]
+    ]
+    return utils.canonical_hash(
+        {
+            "fragments": fragment_list,
+            "status": av.status,
+            "version": av.version,
+            "dates": article_dates(av),
+            "schemas": schema_list,
+        }
+    )
+
+
 class Identical(RuntimeError):
     def __init__(self, msg, av, hashval):
         super(Identical, self).__init__(msg)
@@ -307,11 +456,102 @@ def _identical_articles(raw_original, raw_new, final_new, oldhash, newhash):
 
 
 # TODO: 'quiet' (validation-check) and 'update_fragment' are symptoms of spaghetti logic and need to be removed.
+#
+# content-type compatibility
+#
+
+# POA v3 and VOR v8
+#
+# 1. awards now have an `awardDoi` field.
+#    the presence of this new field shouldn't affect anything.
+# 2. awards may now exclude a list of recipients.
+#    we can't satisfy requests for these articles with older content types.
+
+
+def all_awards_have_recipients(ajson):
+    """returns `True` if all awards in `ajson` have a list of recipients.
+    returns `True` if `ajson` has no `funding` section.
+    returns `True` if `ajson` has no `funding.awards` section."""
+    assert isinstance(ajson, dict), "expected dictionary"
+    funding = ajson.get("funding")
+    if not funding:
+        return True
+    award_list = funding.get("awards")
+    if not award_list:
+        return True
+    for award in award_list:
+        if not "recipients" in award:
+            return False
+    return True
+
+
+def vor_valid_under_previous_version(ajson):
+    "returns True if `ajson` is valid under the previous (deprecated) version of the VOR spec."
+    return all_awards_have_recipients(ajson)
+
+
+def poa_valid_under_previous_version(ajson):
+    "returns True if `ajson` is valid under the previous (deprecated) version of the POA spec."
+    return all_awards_have_recipients(ajson)
+
+
+PREVIOUS_VERSION_CHECKS = {
+    models.VOR: vor_valid_under_previous_version,
+    models.POA: poa_valid_under_previous_version,
+}
+
+
+def content_type_versions(status, ajson):
+    """returns a list of the content-type versions the given article-json can be served as, most recent first.
+    see `api_v2_views.downgrade`."""
+    versions = [row[0] for row in settings.ALL_SCHEMA_IDX[status]]
+    compatible = versions[:1]
+    if len(versions) > 1 and PREVIOUS_VERSION_CHECKS[status](ajson):
+        compatible.append(versions[1])
+    return compatible
+
+
+#
+#
+#
+
+
+def save_article_json(av, ajson, snippet):
+    """saves `av` and stores the given article-json, its snippet and its gzip encoding in `av.rendered`.
+    the size in bytes of the article-json and its gzip encoding are kept on `av` so HEAD requests needn't load either.
+    the article-json is serialised exactly as it's stored so the two are interchangeable.
+    """
+    encoded = utils.json_dumps(ajson).encode("utf-8")
+    # mtime=0: the same article-json is always encoded the same way
+    gzipped = gzip.compress(encoded, mtime=0)
+    av.article_json_v1_length = len(encoded)
+    av.article_json_v1_gzip_length = len(gzipped)
+    av.save()
+    av.rendered, _ = models.ArticleVersionJSON.objects.update_or_create(
+        articleversion=av,
+        defaults={
+            "article_json_v1": ajson,
+            "article_json_v1_snippet": snippet,
+            "article_json_v1_gzip": gzipped,
+        },
+    )
+
+
 def set_article_json(av, data=None, quiet=True, hash_check=True, update_fragment=True):
     """updates the article with the result of the merge operation.
     if the result of the merge was valid, the merged result will be saved.
     if invalid, a ValidationError will be raised"""
     log_context = {"article-version": av, "hash_check": hash_check}
+    msg = "article data is identical to the article data already stored"
+
+    if hash_check and av.article_json_inputs_hash:
+        # nothing the stored article-json was derived from has changed, nor will it with the given `data`.
+        # merging and validating would produce the same raw data, pubdates, metadata, history and
+        # article-json checked by `_identical_articles`.
+        current_inputs = inputs_hash(av)
+        new_inputs = inputs_hash(av, data) if data else current_inputs
+        if current_inputs == new_inputs == av.article_json_inputs_hash:
+            raise Identical(msg, av, av.article_json_hash)
 
     try:
         # `merge` merges the *current* fragment set.
@@ -352,7 +592,6 @@ def set_article_json(av, data=None, quiet=True, hash_check=True, update_fragment
         # backfills (thousands of forced ingest) require skipping when identical
         # day-to-day INGEST and PUBLISH events require this too.
         # happens on multiple deliveries and silent corrections (forced ingest).
-        msg = "article data is identical to the article data already stored"
         raise Identical(
             msg,
             av,
@@ -363,10 +602,10 @@ def set_article_json(av, data=None, quiet=True, hash_check=True, update_fragment
     del result["-published"]  # set in preprocess
 
     # save
-    av.article_json_v1 = result
-    av.article_json_v1_snippet = snippet
     av.article_json_hash = newhash
-    av.save()
+    av.article_json_inputs_hash = inputs_hash(av)
+    av.content_type_versions = content_type_versions(av.status, result)
+    save_article_json(av, result, snippet)
 
     return result
 
@@ -381,6 +620,12 @@ def set_all_article_json(art, **kwargs):
 #
 
 
+def evict_responses(art):
+    "evicts the cached responses for the given article and the related articles that embed its snippets."
+    for av in art.articleversion_set.all():
+        response_cache.evict_all(av)
+
+
 def add_fragment_update_article(art, key, fragment):
     "adds a fragment to an article, re-renders article, sends update event. if an error occurs, update is rolled back and no event is sent"
     with transaction.atomic():
@@ -390,9 +635,12 @@ def add_fragment_update_article(art, key, fragment):
 
         # notify event bus that article change has occurred
         transaction.on_commit(partial(aws_events.notify, art.manuscript_id))
+        transaction.on_commit(partial(evict_responses, art))
 
         # hash check disabled. if fragment added that doesn't alter final article, then fragment should be preserved
-        return set_all_article_json(art, quiet=False, hash_check=False)
+        result = set_all_article_json(art, quiet=False, hash_check=False)
+        logic.update_history(art)
+        return result
 
 
 def delete_fragment_update_article(art, key):
@@ -403,9 +651,12 @@ def delete_fragment_update_article(art, key):
 
         # notify event bus that article change has occurred
         transaction.on_commit(partial(aws_events.notify, art.manuscript_id))
+        transaction.on_commit(partial(evict_responses, art))
 
         # `hash_check=False`: if removing fragment doesn't alter final article, then fragment should still be removed
-        return set_all_article_json(art, quiet=False, hash_check=False)
+        result = set_all_article_json(art, quiet=False, hash_check=False)
+        logic.update_history(art)
+        return result
 
 
 def reset_merged_fragments(art):
@@ -415,14 +666,17 @@ def reset_merged_fragments(art):
     with transaction.atomic():
         # notify event bus that article change has occurred
         transaction.on_commit(partial(aws_events.notify, art.manuscript_id))
+        transaction.on_commit(partial(evict_responses, art))
 
         # `hash_check=False`: reset merged fragments regardless of whether final article-json is changed
-        return set_all_article_json(art, quiet=False, hash_check=False)
+        result = set_all_article_json(art, quiet=False, hash_check=False)
+        logic.update_history(art)
+        return result
 
 
 def validate_merged_fragments(art):
     """for each article version of given article object, merge the fragments and validate them.
-    does not write anything to the database."""
+    does not write any article data to the database."""
     av_list = art.articleversion_set.all()
     for av in av_list:
         print("testing", av)
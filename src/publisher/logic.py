@@ -1,12 +1,21 @@
 import json
-from django.db import connection, reset_queries
+from django.db import (
+    DatabaseError,
+    connection,
+    connections,
+    reset_queries,
+    router,
+    transaction,
+)
 from . import models
 from django.conf import settings
 import logging
 from publisher import utils, relation_logic
 from publisher.utils import ensure, lmap, lfilter, firstnn, second, exsubdict
 from django.utils import timezone
-from django.db.models import Max, F  # , Q, When
+from django.core.cache import cache
+from django.db.models import F, Q, OuterRef, Subquery, TextField  # , When
+from django.db.models.functions import Cast
 from psycopg2.extensions import AsIs
 
 LOG = logging.getLogger(__name__)
@@ -42,7 +51,9 @@ def dictfetchall(cursor):
 
 # @qdebug
 def execute_sql(filename, params):
-    with connection.cursor() as cursor:
+    # raw SQL isn't routed like the ORM is, see `core.routers`
+    alias = router.db_for_read(models.ArticleVersion)
+    with connections[alias].cursor() as cursor:
         cursor.execute(settings.SQL_MAP[filename], params)
         return dictfetchall(cursor)
 
@@ -89,6 +100,29 @@ def article_json(av):
     return av.article_json_v1 or None
 
 
+def article_json_text(av):
+    """returns the *valid* article json for the given article version as it is stored in the database.
+    the stored text is returned as-is, without being deserialised. returns 'null' if invalid.
+    """
+    text = (
+        models.ArticleVersionJSON.objects.filter(pk=av.pk)
+        .annotate(text=Cast("article_json_v1", TextField()))
+        .values_list("text", flat=True)
+        .first()
+    )
+    return text or "null"
+
+
+def article_json_gzip(av):
+    "returns the gzip encoded article json for the given article version or `None` if it hasn't been stored."
+    data = (
+        models.ArticleVersionJSON.objects.filter(pk=av.pk)
+        .values_list("article_json_v1_gzip", flat=True)
+        .first()
+    )
+    return bytes(data) if data is not None else None
+
+
 def article_snippet_json(av, placeholder_if_invalid=True):
     """return the *valid* article snippet json for the given article version.
     if `placeholder_if_invalid=True` and article is invalid, return a stubby 'placeholder'
@@ -105,6 +139,13 @@ def article_snippet_json(av, placeholder_if_invalid=True):
 #
 
 
+def with_snippet(q):
+    """selects the snippet of each article version in `q` but none of the rest of its article-json.
+    cheaper than `select_related("rendered")` as no `ArticleVersionJSON` objects are created.
+    """
+    return q.annotate(article_json_v1_snippet=F("rendered__article_json_v1_snippet"))
+
+
 def validate_pagination_params(page, per_page, order):
     order = str(order).strip().upper()
     # TODO: necessary? this duplicates api_v2_views.request_args a bit ...
@@ -119,85 +160,162 @@ def validate_pagination_params(page, per_page, order):
     return page, per_page, order
 
 
-def latest_published_article_versions(page=1, per_page=-1, order="DESC"):
-    limit = per_page
-    offset = per_page * (page - 1)
+ARTICLE_COUNT_KEYS = {True: "article-count-published", False: "article-count-all"}
+
 
-    sql = """
-    SELECT
-       pav.id, pav.article_id, pav.title, pav.version, pav.status, pav.datetime_published,
-       pav.datetime_record_created, pav.datetime_record_updated
+def article_count(only_published=True):
+    "returns the number of articles with a (published) version. cached until a version is added or published."
+    key = ARTICLE_COUNT_KEYS[only_published]
+    total = cache.get(key)
+    if total is None:
+        if only_published:
+            qs = models.Article.objects.exclude(latest_published_articleversion=None)
+        else:
+            qs = models.Article.objects.exclude(latest_articleversion=None)
+        total = qs.count()
+        cache.set(key, total, settings.ARTICLE_COUNT_TTL)
+    return total
 
-    FROM publisher_articleversion pav,
 
-      (SELECT pav2.article_id,
-              max(version) AS max_ver
-       FROM publisher_articleversion pav2
-       WHERE datetime_published IS NOT NULL
-       GROUP BY pav2.article_id) as pav2,
-       publisher_article pa
+def clear_article_counts():
+    cache.delete_many(list(ARTICLE_COUNT_KEYS.values()))
 
-    WHERE
-       pav.article_id = pav2.article_id AND pav.version = pav2.max_ver
-       AND pav.article_id = pa.id
 
-    ORDER BY datetime_published %s, pa.manuscript_id %s""" % (
-        order,
-        order,
+def update_latest_versions(art):
+    """updates the pointers on the given article to its most recent and most recent published versions.
+    the cached article counts are cleared now and again once the transaction commits."""
+    avs = models.ArticleVersion.objects.filter(article=OuterRef("pk")).order_by(
+        "-version"
     )
+    models.Article.objects.filter(pk=art.pk).update(
+        latest_articleversion=Subquery(avs.values("pk")[:1]),
+        latest_published_articleversion=Subquery(
+            avs.exclude(datetime_published=None).values("pk")[:1]
+        ),
+    )
+    clear_article_counts()
+    # another request may cache the old count before this transaction is committed
+    transaction.on_commit(clear_article_counts)
+
+
+def _after_cursor(cursor, order):
+    """returns a `Q` object that selects article versions ordered after the given
+    `(datetime_published, msid)` pair. unpublished versions come first when ordering
+    descending and last when ordering ascending."""
+    dt, msid = cursor
+    op = "lt" if order == "DESC" else "gt"
+    same_dt = Q(datetime_published=dt) if dt else Q(datetime_published=None)
+    after = same_dt & Q(**{"article__manuscript_id__" + op: msid})
+    if dt is None:
+        if order == "DESC":
+            after |= Q(datetime_published__isnull=False)
+        return after
+    after |= Q(**{"datetime_published__" + op: dt})
+    if order == "ASC":
+        after |= Q(datetime_published=None)
+    return after
+
+
+def _latest_article_versions(q, page, per_page, order, cursor):
+    "orders and paginates the given queryset of article versions for the article list."
+    start = (page - 1) * per_page
+    end = start + per_page
+    if order == "DESC":
+        order_by = [
+            F("datetime_published").desc(nulls_first=True),
+            F("article__manuscript_id").desc(),
+        ]
+    else:
+        order_by = [
+            F("datetime_published").asc(nulls_last=True),
+            F("article__manuscript_id").asc(),
+        ]
+
+    q = with_snippet(q.select_related("article")).order_by(*order_by)
 
-    with connection.cursor() as cursor:
-        total_sql = "select COUNT(*) from (%s) as subq" % sql
-        cursor.execute(total_sql)
-        total = cursor.fetchone()[0]
+    if cursor:
+        # keyset pagination. (datetime_published, manuscript_id) is unique per article,
+        # so rows are never skipped or repeated and there is no OFFSET to scan past.
+        q = q.filter(_after_cursor(cursor, order))
+        start, end = 0, per_page
 
     if per_page > 0:
-        sql += """
+        q = q[start:end]
 
-    LIMIT %s
+    return list(q)
 
-    OFFSET %s""" % (
-            limit,
-            offset,
-        )
 
-    q = models.ArticleVersion.objects.raw(sql)
+def latest_published_article_versions(page=1, per_page=-1, order="DESC", cursor=None):
+    """returns a pair of (total, page of article versions).
+    results begin *after* the `(datetime_published, msid)` pair `cursor`, if given."""
+    total = article_count(only_published=True)
+    q = models.ArticleVersion.objects.filter(
+        article__latest_published_articleversion=F("pk")
+    )
+    return total, _latest_article_versions(q, page, per_page, order, cursor)
 
-    return total, list(q)
 
+def latest_unpublished_article_versions(page=1, per_page=-1, order="DESC", cursor=None):
+    total = article_count(only_published=False)
+    q = models.ArticleVersion.objects.filter(article__latest_articleversion=F("pk"))
+    return total, _latest_article_versions(q, page, per_page, order, cursor)
 
-def latest_unpublished_article_versions(page=1, per_page=-1, order="DESC"):
-    start = (page - 1) * per_page
-    end = start + per_page
-    order_by = ["datetime_published", "article__manuscript_id"]
-    if order == "DESC":
-        order_by = ["-" + o for o in order_by]
-
-    q = (
-        models.ArticleVersion.objects.select_related("article")
-        .annotate(max_version=Max("article__articleversion__version"))
-        .filter(version=F("max_version"))
-        .order_by(*order_by)
-    )
 
-    total = q.count()
+def latest_article_version_list(
+    page=1, per_page=-1, order="DESC", only_published=True, cursor=None
+):
+    """returns a list of the most recent article versions for all articles.
+    `cursor` is an optional `(datetime_published, msid)` pair to continue on from."""
+    args = validate_pagination_params(page, per_page, order)
+    if only_published:
+        return latest_published_article_versions(*args, cursor=cursor)
+    return latest_unpublished_article_versions(*args, cursor=cursor)
 
-    if per_page > 0:
-        q = q[start:end]
 
-    return total, list(q)
+def latest_article_versions(msid_list, only_published=True):
+    """returns the most recent article version for each of the given manuscript ids, in the same order.
+    like `most_recent_article_version` but for many articles in a single query. unknown articles are skipped.
+    """
+    if only_published:
+        q = models.ArticleVersion.objects.filter(
+            article__latest_published_articleversion=F("pk")
+        )
+    else:
+        q = models.ArticleVersion.objects.filter(article__latest_articleversion=F("pk"))
+    q = with_snippet(
+        q.filter(article__manuscript_id__in=msid_list).select_related("article")
+    )
+    idx = {av.article.manuscript_id: av for av in q}
+    return [idx[msid] for msid in msid_list if msid in idx]
 
 
-def latest_article_version_list(page=1, per_page=-1, order="DESC", only_published=True):
-    "returns a list of the most recent article versions for all articles."
-    args = validate_pagination_params(page, per_page, order)
-    if only_published:
-        return latest_published_article_versions(*args)
-    return latest_unpublished_article_versions(*args)
+def export_article_versions(only_published=True, article_json=False):
+    """returns an iterator of the snippet, or the full article-json, of the most recent version of every article, one per line.
+    the stored text is streamed from the database using a server-side cursor and isn't deserialised.
+    """
+    field = "article_json_v1" if article_json else "article_json_v1_snippet"
+    pointer = (
+        "latest_published_articleversion" if only_published else "latest_articleversion"
+    )
+    # the database is chosen now, while the request is being handled, rather than once the
+    # response has started streaming. this is why this function isn't itself a generator.
+    q = (
+        models.ArticleVersionJSON.objects.using(
+            router.db_for_read(models.ArticleVersionJSON)
+        )
+        .filter(**{"articleversion__article__" + pointer: F("pk")})
+        .exclude(**{field + "__isnull": True})
+        .order_by("articleversion__article__manuscript_id")
+        .annotate(text=Cast(field, TextField()))
+        .values_list("text", flat=True)
+    )
+    return (text + "\n" for text in q.iterator(chunk_size=100))
 
 
-def most_recent_article_version(msid, only_published=True):
-    "returns the most recent ArticleVersion for the given manuscript id"
+def most_recent_article_version(msid, only_published=True, defer=False):
+    """returns the most recent ArticleVersion for the given manuscript id.
+    `defer=True` will skip loading the article-json until it is accessed, otherwise it's loaded in the same query.
+    """
     try:
         latest = (
             models.ArticleVersion.objects.select_related("article")
@@ -205,6 +323,9 @@ def most_recent_article_version(msid, only_published=True):
             .order_by("-version")
         )
 
+        if not defer:
+            latest = latest.select_related("rendered")
+
         if only_published:
             latest = latest.exclude(datetime_published=None)
 
@@ -213,14 +334,18 @@ def most_recent_article_version(msid, only_published=True):
         raise models.Article.DoesNotExist()
 
 
-def article_version(msid, version, only_published=True):
-    "returns the specified article version for the given article id"
+def article_version(msid, version, only_published=True, defer=False):
+    """returns the specified article version for the given article id.
+    `defer=True` will skip loading the article-json until it is accessed, otherwise it's loaded in the same query.
+    """
     try:
         qs = (
             models.ArticleVersion.objects.select_related("article")
             .filter(version=version)
             .filter(article__manuscript_id=msid)
         )
+        if not defer:
+            qs = qs.select_related("rendered")
         if only_published:
             qs = qs.exclude(datetime_published=None)
         return qs[0]
@@ -272,62 +397,29 @@ def relationships(msid, only_published=True):
     return extcl + avl
 
 
-def relationships2(msid, only_published=True, include_rpp=True):
-    "returns all relationships for the given `msid`"
-
-    # we can do the SQL queries without this, but we need a DoesNotExist to be raised
-    # if the msid does not exist (or has not been published) yet.
-    # it also simplifies the raw SQL slightly at the expense of an extra db query.
-    av = most_recent_article_version(msid, only_published)
-
-    # returns a list of citations
-    extr_params = [
-        av.id,
-    ]
-    extr = execute_sql("external-relationships-for-msid.sql", extr_params)
-
-    # returns a list of reviewed-preprints JSON snippets
-    rppr = []
-    if include_rpp:
-        rppr_params = [
-            av.id,
-        ]
-        rppr = execute_sql("reviewed-preprints-for-av-id.sql", rppr_params)
-
-    # returns article-json snippets
-    intr_params = [
-        av.id,
-        AsIs("AND datetime_published IS NOT NULL" if only_published else ""),
-    ]
-    intr = execute_sql("internal-relationships-for-msid.sql", intr_params)
-
-    # returns article-json snippets
-    intr_rev_params = [
-        AsIs("AND datetime_published IS NOT NULL" if only_published else ""),
-        msid,
-    ]
-    intr_rev = execute_sql(
-        "internal-reverse-relationships-for-msid.sql", intr_rev_params
-    )
-
-    extr = [json.loads(i["citation"]) for i in extr]
-    rppr = [json.loads(i["content"]) for i in rppr]
-    intr = [json.loads(i["article_json_v1_snippet"]) or "null" for i in intr]
-    intr_rev = [json.loads(i["article_json_v1_snippet"]) or "null" for i in intr_rev]
-
-    av_list = intr + intr_rev
-
-    # unique articleversions only, sorted by manuscript_id, ascending
-    av_map = {av["id"]: av for av in av_list if av}
-    av_list = sorted(av_map.values(), key=lambda d: d["id"])
+def relationships_json(msid, only_published=True, include_rpp=True):
+    """returns all relationships for the given `msid` as a string of JSON.
+    external citations, reviewed-preprints and article snippets are fetched, ordered and
+    de-duplicated in a single query and the stored JSON is never decoded."""
+    params = {
+        "msid": msid,
+        "latest": AsIs(
+            "latest_published_articleversion_id"
+            if only_published
+            else "latest_articleversion_id"
+        ),
+        "include_rpp": include_rpp,
+    }
+    rows = execute_sql("relationships-for-msid.sql", params)
+    if not rows:
+        # msid does not exist (or has not been published) yet
+        raise models.Article.DoesNotExist()
+    return rows[0]["content"]
 
-    if include_rpp:
-        # lsh@2023-11-17: new buslogic, exclude any rpp that has a matching msid for a POA or VOR relation.
-        # -https://github.com/elifesciences/issues/issues/8529
-        rppr = [rpp for rpp in rppr if str(rpp["id"]) not in av_map]
 
-    # any external citations precede internal relations
-    return extr + rppr + av_list
+def relationships2(msid, only_published=True, include_rpp=True):
+    "returns all relationships for the given `msid`"
+    return json.loads(relationships_json(msid, only_published, include_rpp))
 
 
 #
@@ -366,7 +458,7 @@ EXCLUDE_RECEIVED_ACCEPTED_DATES = [models.EDITORIAL, models.INSIGHT]
 def article_version_history__v1(msid, only_published=True):
     "returns a list of snippets for the history of the given article"
     article = models.Article.objects.get(manuscript_id=msid)
-    avl = article.articleversion_set.all()
+    avl = with_snippet(article.articleversion_set.all())
     if only_published:
         avl = avl.exclude(datetime_published=None)
 
@@ -398,8 +490,10 @@ def article_version_history__v2(msid, only_published=True):
     v2 of this functions also returns pre-print events.
     returns None if no version history found."""
 
-    q = models.ArticleVersion.objects.select_related("article").filter(
-        article__manuscript_id=msid
+    q = with_snippet(
+        models.ArticleVersion.objects.select_related("article").filter(
+            article__manuscript_id=msid
+        )
     )
     if only_published:
         q = q.exclude(datetime_published=None)
@@ -455,3 +549,89 @@ def article_version_history__v2(msid, only_published=True):
         del struct["sentForReview"]
 
     return struct
+
+
+# the `ArticleHistory` field for each (history version, only_published) pair
+HISTORY_FIELDS = {
+    (1, True): "v1",
+    (1, False): "v1_unpublished",
+    (2, True): "v2",
+    (2, False): "v2_unpublished",
+}
+
+
+def render_history(msid, version, only_published=True):
+    "returns the version history document for the given article or `None` if it has no versions to show."
+    if version == 1:
+        try:
+            return article_version_history__v1(msid, only_published)
+        except models.Article.DoesNotExist:
+            return None
+    return article_version_history__v2(msid, only_published)
+
+
+def update_history(art):
+    """renders and stores the version history documents of the given article.
+    must be called whenever an article, its versions or its events change."""
+    history = {
+        field: render_history(art.manuscript_id, version, only_published)
+        for (version, only_published), field in HISTORY_FIELDS.items()
+    }
+    models.ArticleHistory.objects.update_or_create(article=art, defaults=history)
+
+
+def article_version_history_json(msid, version, only_published=True):
+    """returns the version history document for the given article as a string of JSON.
+    documents are rendered if they haven't been stored yet (see `update_history`).
+    raises `Article.DoesNotExist` if the article has no versions to show."""
+    field = HISTORY_FIELDS[(version, only_published)]
+    rows = list(
+        models.ArticleHistory.objects.filter(pk=msid)
+        .annotate(text=Cast(field, TextField()))
+        .values_list("text", flat=True)
+    )
+    if rows:
+        text = rows[0]
+    else:
+        history = render_history(msid, version, only_published)
+        text = utils.json_dumps(history) if history else None
+    if text in [None, "null"]:
+        raise models.Article.DoesNotExist()
+    return text
+
+
+#
+# warm-up
+#
+
+# parameters for running each of the raw SQL queries once. none of them match anything.
+SQL_WARM_UP_PARAMS = {
+    "relationships-for-msid.sql": {
+        "msid": 0,
+        "latest": AsIs("latest_published_articleversion_id"),
+        "include_rpp": True,
+    },
+}
+
+
+def prime(cursor):
+    "runs each of the raw SQL queries once so the database has loaded what they need."
+    for filename, params in SQL_WARM_UP_PARAMS.items():
+        cursor.execute(settings.SQL_MAP[filename], params)
+        cursor.fetchall()
+
+
+def warm_up():
+    """connects to each database and primes the connections before any requests are served.
+    pooled databases open their minimum number of connections.
+    a database that can't be reached is connected to as usual once requests are served.
+    """
+    for conn in connections.all():
+        try:
+            if hasattr(conn, "warm_up"):
+                conn.warm_up(prime)
+            else:
+                with conn.cursor() as cursor:
+                    prime(cursor)
+        except DatabaseError:
+            LOG.exception("failed to warm up database %r", conn.alias)
@@ -0,0 +1,44 @@
+from publisher import logic, utils
+from django.core.management.base import BaseCommand
+import sys
+
+
+class Command(BaseCommand):
+    help = "writes the snippet (or article-json) of the most recent version of every article as newline delimited json"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--article-json",
+            action="store_true",
+            help="write the full article-json rather than the snippet",
+        )
+        parser.add_argument(
+            "--unpublished",
+            action="store_true",
+            help="include unpublished article versions",
+        )
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument(
+            "--output", default="-", help="path to file, default stdout"
+        )
+
+    def handle(self, *args, **options):
+        lines = logic.export_article_versions(
+            only_published=not options["unpublished"],
+            article_json=options["article_json"],
+        )
+        chunks = (
+            utils.gzip_stream(lines)
+            if options["gzip"]
+            else (line.encode("utf-8") for line in lines)
+        )
+        if options["output"] == "-":
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+        else:
+            with open(options["output"], "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        sys.exit(0)
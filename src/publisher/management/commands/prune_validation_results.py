@@ -0,0 +1,12 @@
+from publisher import fragment_logic
+from django.core.management.base import BaseCommand
+import sys
+
+
+class Command(BaseCommand):
+    help = "deletes recorded validation results for schemas that have changed or are no longer used. run after a deploy that changes the schemas."
+
+    def handle(self, *args, **options):
+        num = fragment_logic.prune_validation_results()
+        self.stdout.write("pruned %s validation results" % num)
+        sys.exit(0)
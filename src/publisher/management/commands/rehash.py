@@ -1,4 +1,5 @@
 from publisher import models, fragment_logic
+from publisher.utils import StateError
 from django.core.management.base import BaseCommand
 import sys
 import logging
@@ -7,22 +8,55 @@ from django.db import transaction
 LOG = logging.getLogger(__name__)
 
 
+def inputs_hash(av):
+    """returns the `fragment_logic.inputs_hash` of `av` if its stored article-json is what its current
+    fragments merge into, otherwise `None` so the next ingest merges and validates them.
+    """
+    try:
+        result = fragment_logic.pre_process(av, fragment_logic.merge(av))
+    except StateError:
+        return None
+    result = fragment_logic.valid(result)
+    if not result:
+        return None
+    del result["-published"]
+    if fragment_logic.hash_ajson(result) != fragment_logic.hash_ajson(
+        av.article_json_v1
+    ):
+        return None
+    return fragment_logic.inputs_hash(av)
+
+
 class Command(BaseCommand):
-    help = (
-        "calculates the hash for the stored article-json. completes in less than 2 mins"
-    )
+    help = "calculates the hash, the gzip encoding, their sizes and the compatible content-type versions for the stored article-json, and the hashes of the fragments and inputs it was derived from"
 
     def handle(self, *args, **options):
         try:
             with transaction.atomic():
+                q = models.ArticleFragment.objects.filter(fragment_hash=None)
+                for frag in q.iterator():
+                    frag.fragment_hash = fragment_logic.hash_ajson(frag.fragment)
+                    frag.save(update_fields=["fragment_hash"])
+
                 # poa then vor articles. expect slowdown at about 36%
-                q = models.ArticleVersion.objects.all().order_by("status")
+                q = models.ArticleVersion.objects.select_related("rendered").order_by(
+                    "status"
+                )
                 num = q.count()
                 # `.iterator()` to use server-side cursor and avoid thrashing memory
                 # https://docs.djangoproject.com/en/3.2/ref/models/querysets/#iterator
                 for i, av in enumerate(q.iterator()):
                     av.article_json_hash = fragment_logic.hash_ajson(av.article_json_v1)
-                    av.save()
+                    if av.article_json_v1:
+                        av.article_json_inputs_hash = inputs_hash(av)
+                        av.content_type_versions = fragment_logic.content_type_versions(
+                            av.status, av.article_json_v1
+                        )
+                        fragment_logic.save_article_json(
+                            av, av.article_json_v1, av.article_json_v1_snippet
+                        )
+                    else:
+                        av.save()
                     # 13 of 152
                     print("%s of %s" % (i, num))
         except KeyboardInterrupt:
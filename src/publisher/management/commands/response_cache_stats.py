@@ -0,0 +1,12 @@
+from publisher import response_cache
+from django.core.management.base import BaseCommand
+import json
+import sys
+
+
+class Command(BaseCommand):
+    help = "prints the hit and miss counts for the API response cache. counts for the local (in-process) cache are for this process only."
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(response_cache.stats(), indent=4))
+        sys.exit(0)
@@ -0,0 +1,22 @@
+from publisher import models, logic
+from django.core.management.base import BaseCommand
+import sys
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "renders and stores the version history documents of every article"
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                q = models.Article.objects.all().order_by("manuscript_id")
+                num = q.count()
+                for i, art in enumerate(q.iterator()):
+                    logic.update_history(art)
+                    print("%s of %s" % (i, num))
+        except KeyboardInterrupt:
+            print("ctrl-c caught")
+            sys.exit(1)
+
+        sys.exit(0)
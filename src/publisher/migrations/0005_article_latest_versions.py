@@ -0,0 +1,52 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_latest_versions(apps, schema_editor):
+    Article = apps.get_model("publisher", "Article")
+    ArticleVersion = apps.get_model("publisher", "ArticleVersion")
+    avs = ArticleVersion.objects.filter(article=models.OuterRef("pk")).order_by(
+        "-version"
+    )
+    Article.objects.update(
+        latest_articleversion=models.Subquery(avs.values("pk")[:1]),
+        latest_published_articleversion=models.Subquery(
+            avs.exclude(datetime_published=None).values("pk")[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0004_articleversionreviewedpreprintrelation_reviewedpreprint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="latest_articleversion",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="publisher.articleversion",
+            ),
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="latest_published_articleversion",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="publisher.articleversion",
+            ),
+        ),
+        migrations.RunPython(populate_latest_versions, migrations.RunPython.noop),
+    ]
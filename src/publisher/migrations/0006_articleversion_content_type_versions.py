@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:03
+
+import annoying.fields
+from django.db import migrations
+import publisher.utils
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0005_article_latest_versions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="articleversion",
+            name="content_type_versions",
+            field=annoying.fields.JSONField(
+                blank=True,
+                deserializer=publisher.utils.ordered_json_loads,
+                help_text="content-type versions the article-json can be served as, most recent first. see `fragment_logic.content_type_versions`",
+                null=True,
+                serializer=publisher.utils.json_dumps,
+            ),
+        ),
+    ]
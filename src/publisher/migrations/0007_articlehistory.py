@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:18
+
+import annoying.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import publisher.utils
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0006_articleversion_content_type_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleHistory",
+            fields=[
+                (
+                    "article",
+                    models.OneToOneField(
+                        db_column="manuscript_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="history",
+                        serialize=False,
+                        to="publisher.article",
+                        to_field="manuscript_id",
+                    ),
+                ),
+                (
+                    "v1",
+                    annoying.fields.JSONField(
+                        blank=True,
+                        deserializer=publisher.utils.ordered_json_loads,
+                        help_text="published versions, history v1",
+                        null=True,
+                        serializer=publisher.utils.json_dumps,
+                    ),
+                ),
+                (
+                    "v1_unpublished",
+                    annoying.fields.JSONField(
+                        blank=True,
+                        deserializer=publisher.utils.ordered_json_loads,
+                        help_text="all versions, history v1",
+                        null=True,
+                        serializer=publisher.utils.json_dumps,
+                    ),
+                ),
+                (
+                    "v2",
+                    annoying.fields.JSONField(
+                        blank=True,
+                        deserializer=publisher.utils.ordered_json_loads,
+                        help_text="published versions, history v2",
+                        null=True,
+                        serializer=publisher.utils.json_dumps,
+                    ),
+                ),
+                (
+                    "v2_unpublished",
+                    annoying.fields.JSONField(
+                        blank=True,
+                        deserializer=publisher.utils.ordered_json_loads,
+                        help_text="all versions, history v2",
+                        null=True,
+                        serializer=publisher.utils.json_dumps,
+                    ),
+                ),
+                ("datetime_record_updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0007_articlehistory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="articleversion",
+            name="article_json_v1_gzip",
+            field=models.BinaryField(
+                blank=True,
+                help_text="gzip encoded article-json, served to clients that accept it. see `fragment_logic.set_article_json`",
+                null=True,
+            ),
+        ),
+    ]
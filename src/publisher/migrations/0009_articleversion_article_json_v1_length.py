@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0008_articleversion_article_json_v1_gzip"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="articleversion",
+            name="article_json_v1_gzip_length",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="size in bytes of the gzip encoded article-json. see `fragment_logic.save_article_json`",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="articleversion",
+            name="article_json_v1_length",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="size in bytes of the stored article-json. see `fragment_logic.save_article_json`",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:50
+
+import annoying.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import publisher.utils
+
+# plain SQL, the article-json is copied as-is without passing through Python
+COPY_ARTICLE_JSON = """
+INSERT INTO publisher_articleversionjson
+    (articleversion_id, article_json_v1, article_json_v1_snippet, article_json_v1_gzip)
+SELECT id, article_json_v1, article_json_v1_snippet, article_json_v1_gzip
+FROM publisher_articleversion
+WHERE article_json_v1 IS NOT NULL OR article_json_v1_snippet IS NOT NULL
+"""
+
+RESTORE_ARTICLE_JSON = """
+UPDATE publisher_articleversion SET
+    article_json_v1 = (SELECT article_json_v1 FROM publisher_articleversionjson WHERE articleversion_id = publisher_articleversion.id),
+    article_json_v1_snippet = (SELECT article_json_v1_snippet FROM publisher_articleversionjson WHERE articleversion_id = publisher_articleversion.id),
+    article_json_v1_gzip = (SELECT article_json_v1_gzip FROM publisher_articleversionjson WHERE articleversion_id = publisher_articleversion.id)
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0009_articleversion_article_json_v1_length"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArticleVersionJSON",
+            fields=[
+                (
+                    "articleversion",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rendered",
+                        serialize=False,
+                        to="publisher.articleversion",
+                    ),
+                ),
+                (
+                    "article_json_v1",
+                    annoying.fields.JSONField(
+                        blank=True,
+                        deserializer=publisher.utils.ordered_json_loads,
+                        help_text="Valid article-json.",
+                        null=True,
+                        serializer=publisher.utils.json_dumps,
+                    ),
+                ),
+                (
+                    "article_json_v1_snippet",
+                    annoying.fields.JSONField(
+                        blank=True,
+                        deserializer=publisher.utils.ordered_json_loads,
+                        help_text="Valid article-json snippet, extracted from the valid article-json",
+                        null=True,
+                        serializer=publisher.utils.json_dumps,
+                    ),
+                ),
+                (
+                    "article_json_v1_gzip",
+                    models.BinaryField(
+                        blank=True,
+                        help_text="gzip encoded article-json, served to clients that accept it. see `fragment_logic.save_article_json`",
+                        null=True,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunSQL(COPY_ARTICLE_JSON, RESTORE_ARTICLE_JSON),
+        migrations.RemoveField(
+            model_name="articleversion",
+            name="article_json_v1",
+        ),
+        migrations.RemoveField(
+            model_name="articleversion",
+            name="article_json_v1_gzip",
+        ),
+        migrations.RemoveField(
+            model_name="articleversion",
+            name="article_json_v1_snippet",
+        ),
+        migrations.AlterField(
+            model_name="articleversion",
+            name="article_json_v1_gzip_length",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="size in bytes of the gzip encoded article-json. see `fragment_logic.save_article_json`",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="articleversion",
+            name="article_json_v1_length",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="size in bytes of the stored article-json. see `fragment_logic.save_article_json`",
+                null=True,
+            ),
+        ),
+    ]
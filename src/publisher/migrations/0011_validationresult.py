@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0010_articleversionjson"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ValidationResult",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "content_hash",
+                    models.CharField(
+                        help_text="`utils.canonical_hash` of the valid article-json",
+                        max_length=32,
+                    ),
+                ),
+                (
+                    "schema",
+                    models.CharField(
+                        help_text="path to the schema file", max_length=255
+                    ),
+                ),
+                (
+                    "schema_hash",
+                    models.CharField(
+                        help_text="`utils.canonical_hash` of the schema. a schema changed in place is a different schema.",
+                        max_length=32,
+                    ),
+                ),
+                ("datetime_record_created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "unique_together": {("content_hash", "schema", "schema_hash")},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("publisher", "0011_validationresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="articlefragment",
+            name="fragment_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="md5 digest of the fragment. see `fragment_logic.add`",
+                max_length=32,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="articleversion",
+            name="article_json_inputs_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="md5 digest of everything the article-json was derived from. see `fragment_logic.inputs_hash`",
+                max_length=32,
+                null=True,
+            ),
+        ),
+    ]
@@ -206,6 +206,25 @@ class Article(models.Model):
     def ejp_rev_type(self):
         return EJP_TYPE_IDX.get(self.ejp_type, "unknown")
 
+    # denormalised pointers to the most recent version and the most recent published version.
+    # maintained by `logic.update_latest_versions`, used when listing articles.
+    latest_articleversion = models.ForeignKey(
+        "ArticleVersion",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    latest_published_articleversion = models.ForeignKey(
+        "ArticleVersion",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+
     datetime_record_created = models.DateTimeField(
         auto_now_add=True, help_text="Date this article was created"
     )
@@ -213,30 +232,14 @@ class Article(models.Model):
         auto_now=True, help_text="Date this article was updated"
     )
 
-    def earliest_poa(self, defer=True):
+    def earliest_poa(self):
         try:
-            if defer:
-                return (
-                    self.articleversion_set.defer(
-                        "article_json_v1", "article_json_v1_snippet"
-                    )
-                    .filter(status=POA)
-                    .earliest("version")
-                )
             return self.articleversion_set.filter(status=POA).earliest("version")
         except models.ObjectDoesNotExist:
             return None
 
-    def earliest_vor(self, defer=True):
+    def earliest_vor(self):
         try:
-            if defer:
-                return (
-                    self.articleversion_set.defer(
-                        "article_json_v1", "article_json_v1_snippet"
-                    )
-                    .filter(status=VOR)
-                    .earliest("version")
-                )
             return self.articleversion_set.filter(status=VOR).earliest("version")
         except models.ObjectDoesNotExist:
             return None
@@ -303,13 +306,7 @@ class ArticleVersion(models.Model):
         blank=True, null=True, help_text="Date article first appeared on website"
     )
 
-    # TODO: rename these fields to 'article_json' and 'article_json_snippet'
-    article_json_v1 = JSONField(null=True, blank=True, help_text="Valid article-json.")
-    article_json_v1_snippet = JSONField(
-        null=True,
-        blank=True,
-        help_text="Valid article-json snippet, extracted from the valid article-json",
-    )
+    # the article-json itself is kept in `ArticleVersionJSON`.
     # TODO: remove NULL constraint once everything has a hash.
     article_json_hash = models.CharField(
         max_length=32,
@@ -318,6 +315,34 @@ class ArticleVersion(models.Model):
         help_text="md5 digest of merged result. see `fragment_logic.hash_ajson` for algorithm",
     )
 
+    article_json_inputs_hash = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="md5 digest of everything the article-json was derived from. see `fragment_logic.inputs_hash`",
+    )
+
+    article_json_v1_length = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="size in bytes of the stored article-json. see `fragment_logic.save_article_json`",
+    )
+    article_json_v1_gzip_length = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="size in bytes of the gzip encoded article-json. see `fragment_logic.save_article_json`",
+    )
+
+    # TODO: remove NULL constraint once everything has been rehashed.
+    content_type_versions = JSONField(
+        null=True,
+        blank=True,
+        help_text="content-type versions the article-json can be served as, most recent first. see `fragment_logic.content_type_versions`",
+    )
+
     datetime_record_created = models.DateTimeField(
         auto_now_add=True, help_text="Date this article was created"
     )
@@ -336,6 +361,33 @@ class ArticleVersion(models.Model):
     def get_absolute_url(self):
         return self.article.dxdoi_url()
 
+    def _rendered(self):
+        try:
+            return self.rendered
+        except ArticleVersionJSON.DoesNotExist:
+            return None
+
+    @property
+    def article_json_v1(self):
+        "the valid article-json or `None`. fetched when accessed unless `rendered` was selected."
+        rendered = self._rendered()
+        return rendered.article_json_v1 if rendered else None
+
+    @property
+    def article_json_v1_snippet(self):
+        """the valid article-json snippet or `None`.
+        fetched when accessed unless `rendered` was selected or it was selected alone by `logic.with_snippet`.
+        """
+        if "_snippet" in self.__dict__:
+            return self._snippet
+        rendered = self._rendered()
+        return rendered.article_json_v1_snippet if rendered else None
+
+    @article_json_v1_snippet.setter
+    def article_json_v1_snippet(self, snippet):
+        # set by a `logic.with_snippet` annotation
+        self._snippet = snippet
+
     def __str__(self):
         return "%s v%s" % (self.article.manuscript_id, self.version)
 
@@ -343,6 +395,64 @@ class ArticleVersion(models.Model):
         return "<ArticleVersion %s>" % self
 
 
+class ArticleVersionJSON(models.Model):
+    """the article-json of an article version and its encodings.
+    kept apart from `ArticleVersion` so queries over article versions don't drag it along.
+    maintained by `fragment_logic.save_article_json`."""
+
+    articleversion = models.OneToOneField(
+        ArticleVersion,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="rendered",
+    )
+    # TODO: rename these fields to 'article_json' and 'article_json_snippet'
+    article_json_v1 = JSONField(null=True, blank=True, help_text="Valid article-json.")
+    article_json_v1_snippet = JSONField(
+        null=True,
+        blank=True,
+        help_text="Valid article-json snippet, extracted from the valid article-json",
+    )
+    article_json_v1_gzip = models.BinaryField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="gzip encoded article-json, served to clients that accept it. see `fragment_logic.save_article_json`",
+    )
+
+    def __str__(self):
+        return "%s article-json" % self.articleversion
+
+    def __repr__(self):
+        return "<ArticleVersionJSON %s>" % self
+
+
+class ValidationResult(models.Model):
+    """article-json found to be valid against a schema, identified by it's hash.
+    valid article-json isn't validated against the same schema again, see `fragment_logic._validate`.
+    results for schemas that have changed are pruned with the `prune_validation_results` command.
+    """
+
+    content_hash = models.CharField(
+        max_length=32, help_text="`utils.canonical_hash` of the valid article-json"
+    )
+    schema = models.CharField(max_length=255, help_text="path to the schema file")
+    schema_hash = models.CharField(
+        max_length=32,
+        help_text="`utils.canonical_hash` of the schema. a schema changed in place is a different schema.",
+    )
+    datetime_record_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "%s valid against %s" % (self.content_hash, self.schema)
+
+    def __repr__(self):
+        return "<ValidationResult %s>" % self
+
+    class Meta:
+        unique_together = ("content_hash", "schema", "schema_hash")
+
+
 # the bulk of the article data, derived from the xml via the bot-lax adaptor
 XML2JSON = "xml->json"
 
@@ -363,6 +473,13 @@ class ArticleFragment(models.Model):
         max_length=25, help_text='the type of fragment, eg "xml", "content-header", etc'
     )
     fragment = JSONField(help_text="partial piece of article data to be merged in")
+    fragment_hash = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="md5 digest of the fragment. see `fragment_logic.add`",
+    )
     position = models.PositiveSmallIntegerField(
         default=1,
         help_text="position in the merge order with lower fragments merged first",
@@ -412,6 +529,38 @@ def article_event_choices():
     ]
 
 
+class ArticleHistory(models.Model):
+    """the version history documents of an article, rendered once when the article changes.
+    maintained by `logic.update_history`."""
+
+    # keyed by manuscript id so a history can be fetched without a join
+    article = models.OneToOneField(
+        Article,
+        to_field="manuscript_id",
+        db_column="manuscript_id",
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="history",
+    )
+    # `None` if the article has no versions to show
+    v1 = JSONField(null=True, blank=True, help_text="published versions, history v1")
+    v1_unpublished = JSONField(
+        null=True, blank=True, help_text="all versions, history v1"
+    )
+    v2 = JSONField(null=True, blank=True, help_text="published versions, history v2")
+    v2_unpublished = JSONField(
+        null=True, blank=True, help_text="all versions, history v2"
+    )
+
+    datetime_record_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s history" % self.article_id
+
+    def __repr__(self):
+        return "<ArticleHistory %s>" % self
+
+
 class ArticleEvent(models.Model):
     # when the Article is deleted, delete this article event
     article = models.ForeignKey(Article, on_delete=models.CASCADE)
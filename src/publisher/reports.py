@@ -14,7 +14,6 @@ LOG = logging.getLogger(__name__)
 def article_version_list_as_csv():
     q = (
         models.ArticleVersion.objects.select_related("article")
-        .defer("article_json_v1", "article_json_v1_snippet")
         .order_by("article__manuscript_id", "version")
         .all()
     )
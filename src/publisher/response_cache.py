@@ -0,0 +1,211 @@
+"""an optional cache of rendered API responses.
+
+responses are kept either in this process (`LocalBackend`) or in a Django cache shared by all
+processes (`SharedBackend`). cache keys include a per-article 'generation' that is bumped when the
+article changes (see `evict`), so stale responses are never looked up again.
+
+the local backend can only bump the generation within the process that made the change, so its
+entries also expire after `RESPONSE_CACHE_TTL` seconds so other processes eventually serve the
+change too."""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from core import metrics
+from publisher import relation_logic as relationships
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class LRUCache:
+    "a thread-safe mapping of at most `maxsize` items that discards the least recently used item when full."
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        "returns the value for `key` or `None` if it's not present or has expired."
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize < 1:
+            return
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete_where(self, pred):
+        "deletes all items whose key satisfies `pred`"
+        with self.lock:
+            for key in [key for key in self.data if pred(key)]:
+                del self.data[key]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class LocalBackend:
+    "keeps responses in an `LRUCache` in this process."
+
+    def __init__(self, maxsize, ttl):
+        self.cache = LRUCache(maxsize, ttl)
+        self.generations = {}
+        self.counters = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+    def enabled(self):
+        return self.cache.maxsize > 0
+
+    def generation(self, msid):
+        return self.generations.get(msid, 0)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def evict(self, msid):
+        with self.lock:
+            self.generations[msid] = self.generation(msid) + 1
+        # nothing will look these up again, free the memory now
+        self.cache.delete_where(lambda key: key[0] == msid)
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        return {
+            "backend": "local",
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            **self.counters,
+        }
+
+
+class SharedBackend:
+    """keeps responses in the Django cache named `alias`.
+    hit and miss counters are also kept in the cache and are shared by all processes."""
+
+    def __init__(self, alias, ttl):
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        # cache connections are per-thread
+        return caches[self.alias]
+
+    def enabled(self):
+        return True
+
+    def generation(self, msid):
+        gen_key = "lax:generation:%s" % msid
+        gen = self.cache.get(gen_key)
+        if gen is None:
+            # another process may have set it first
+            self.cache.add(gen_key, uuid.uuid4().hex, None)
+            gen = self.cache.get(gen_key)
+        return gen
+
+    def _key(self, key):
+        # keys include the 'Accept' header and must be made safe for memcached
+        return "lax:response:%s" % hashlib.md5(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, self.ttl)
+
+    def evict(self, msid):
+        self.cache.set("lax:generation:%s" % msid, uuid.uuid4().hex, None)
+
+    def count(self, counter):
+        counter_key = "lax:counter:%s" % counter
+        try:
+            self.cache.incr(counter_key)
+        except ValueError:
+            # counter doesn't exist (yet)
+            self.cache.add(counter_key, 1, None)
+
+    def stats(self):
+        return {
+            "backend": self.alias,
+            "hits": self.cache.get("lax:counter:hits", 0),
+            "misses": self.cache.get("lax:counter:misses", 0),
+        }
+
+
+def backend():
+    "returns the shared backend if a 'responses' cache is configured, else the local backend."
+    if "responses" in settings.CACHES:
+        return SharedBackend("responses", settings.RESPONSE_CACHE_TTL)
+    return LocalBackend(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL)
+
+
+BACKEND = backend()
+
+
+def enabled():
+    return BACKEND.enabled()
+
+
+def key(msid, *args):
+    """returns a cache key for a response about the given article.
+    keys include the article's generation and are only valid until it's evicted."""
+    msid = int(msid)
+    return (msid, BACKEND.generation(msid)) + args
+
+
+def get(cache_key):
+    "returns a cached response or `None`. hits and misses are counted."
+    value = BACKEND.get(cache_key)
+    BACKEND.count("misses" if value is None else "hits")
+    metrics.RESPONSE_CACHE.inc(result="miss" if value is None else "hit")
+    return value
+
+
+def put(cache_key, value):
+    BACKEND.set(cache_key, value)
+
+
+def stats():
+    "returns a map of hit and miss counts and other details about the backend."
+    return BACKEND.stats()
+
+
+def evict(msid):
+    "evicts all cached responses for the given article."
+    BACKEND.evict(int(msid))
+
+
+def evict_all(av):
+    "evicts all cached responses for the article of the given article version and any articles related to it."
+    evict(av.article.manuscript_id)
+    for art in relationships.internal_relationships_for_article_version(av):
+        evict(art.manuscript_id)
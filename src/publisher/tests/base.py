@@ -1,8 +1,9 @@
 from io import StringIO
 import os, json
 from django.test import TestCase as DjangoTestCase, TransactionTestCase
-from publisher import models, utils, ajson_ingestor, relation_logic
+from publisher import models, utils, ajson_ingestor, relation_logic, logic
 from django.core.management import call_command as dj_call_command
+from django.core.cache import cache
 import unittest
 
 THIS_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -73,6 +74,9 @@ class SimpleBaseCase(unittest.TestCase):
             )
             av.datetime_published = None
             av.save()
+        art = models.Article.objects.get(manuscript_id=msid)
+        logic.update_latest_versions(art)
+        logic.update_history(art)
 
     def call_command(self, *args, **kwargs):
         stdout = StringIO()
@@ -93,11 +97,16 @@ class SimpleBaseCase(unittest.TestCase):
 
 
 class BaseCase(SimpleBaseCase, DjangoTestCase):
-    pass
+    def _pre_setup(self):
+        super()._pre_setup()
+        # the cache isn't rolled back with the database between tests
+        cache.clear()
 
 
 class TransactionBaseCase(SimpleBaseCase, TransactionTestCase):
-    pass
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
 
 
 # ---
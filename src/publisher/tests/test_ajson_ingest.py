@@ -11,6 +11,7 @@ from unittest import skip
 from unittest.mock import patch
 from publisher import logic
 from django.test import Client, override_settings
+from django.conf import settings
 from django.urls import reverse
 
 
@@ -48,6 +49,74 @@ class IngestIdentical(BaseCase):
             )
             self.assertFalse(mock.called)
 
+    def test_ingest_identical_not_merged(self):
+        "identical data is detected before any fragments are merged or validated"
+        ajson_ingestor.ingest(self.ajson)
+        av = models.ArticleVersion.objects.get(article__manuscript_id=self.msid)
+        self.assertTrue(av.article_json_inputs_hash)
+        with patch("publisher.fragment_logic.merge") as merge:
+            self.assertRaises(
+                fragment_logic.Identical, ajson_ingestor.ingest, self.ajson, force=True
+            )
+        self.assertFalse(merge.called)
+
+    def test_ingest_identical_schema_changed(self):
+        "identical data is merged and validated again when a schema has changed"
+        ajson_ingestor.ingest(self.ajson)
+        schema = settings.SCHEMA_IDX["vor"]
+        with patch.dict(utils._SCHEMA_HASHES, {schema: "changed"}):
+            with patch(
+                "publisher.fragment_logic.merge", wraps=fragment_logic.merge
+            ) as merge:
+                self.assertRaises(
+                    fragment_logic.Identical, ajson_ingestor.ingest, self.ajson
+                )
+        self.assertTrue(merge.called)
+
+    def test_inputs_hash(self):
+        "the inputs hash changes with the fragments of an article version"
+        ajson_ingestor.ingest(self.ajson)
+        av = models.ArticleVersion.objects.get(article__manuscript_id=self.msid)
+        inputs_hash = fragment_logic.inputs_hash(av)
+        self.assertEqual(inputs_hash, av.article_json_inputs_hash)
+        self.assertEqual(inputs_hash, fragment_logic.inputs_hash(av, self.ajson))
+
+        # fragments that haven't been hashed are hashed as they're read
+        models.ArticleFragment.objects.update(fragment_hash=None)
+        self.assertEqual(inputs_hash, fragment_logic.inputs_hash(av))
+
+        self.ajson["article"]["title"] = "foo"
+        self.assertNotEqual(inputs_hash, fragment_logic.inputs_hash(av, self.ajson))
+
+        fragment_logic.add(av.article, "frag1", {"title": "foo"})
+        self.assertNotEqual(inputs_hash, fragment_logic.inputs_hash(av))
+
+    def test_rehash_inputs_hash(self):
+        "`rehash` only stores the inputs hash of article-json that's what the current fragments merge into"
+        ajson_ingestor.ingest(self.ajson)
+        av = models.ArticleVersion.objects.get(article__manuscript_id=self.msid)
+        expected = av.article_json_inputs_hash
+        models.ArticleVersion.objects.update(article_json_inputs_hash=None)
+        models.ArticleFragment.objects.update(fragment_hash=None)
+
+        retcode, _ = self.call_command("rehash")
+        self.assertEqual(retcode, 0)
+        av = self.freshen(av)
+        self.assertEqual(av.article_json_inputs_hash, expected)
+
+        # stale article-json
+        ajson = av.article_json_v1
+        ajson["title"] = "foo"
+        models.ArticleVersionJSON.objects.update(article_json_v1=ajson)
+        self.call_command("rehash")
+        av = self.freshen(av)
+        self.assertIsNone(av.article_json_inputs_hash)
+
+        # the next ingest merges the fragments and replaces the stale article-json
+        ajson_ingestor.ingest(self.ajson, force=True)
+        av = self.freshen(av)
+        self.assertEqual(av.article_json_v1["title"], self.ajson["article"]["title"])
+
     def test_ingest_identical_except_pubdate(self):
         "an ingest or silent correction (forced ingest) with just the pubdate changed"
         ajson_ingestor.ingest(self.ajson)
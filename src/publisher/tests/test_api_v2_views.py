@@ -1,6 +1,8 @@
 import pytest
-from core import middleware as mware
+from core import middleware as mware, routers
 from datetime import timedelta
+import gzip
+import tempfile
 from . import base
 from os.path import join
 import json
@@ -14,6 +16,7 @@ from publisher import (
 )
 from django.test import Client, override_settings
 from django.urls import reverse
+from publisher.utils import lmap
 from django.conf import settings
 from unittest.mock import patch, Mock
 
@@ -165,9 +168,12 @@ def test_accept_types():
     msid = 16695
     ajson_fixture_v1 = join(base.FIXTURE_DIR, "ajson", "elife-16695-v1.xml.json")
     poa_fixture = json.load(open(ajson_fixture_v1, "r"))["article"]
-    mock = Mock(article_json_v1=poa_fixture, status="poa")
+    mock = Mock(article_json_v1=poa_fixture, status="poa", content_type_versions=None)
 
-    with patch("publisher.logic.most_recent_article_version", return_value=mock):
+    with patch("publisher.logic.most_recent_article_version", return_value=mock), patch(
+        "publisher.logic.article_json_text",
+        return_value=json.dumps(mock.article_json_v1),
+    ):
         for i, (client_accepts, expected_accepted) in enumerate(cases):
             url = reverse("v2:article", kwargs={"msid": msid})
             resp = Client().get(url, HTTP_ACCEPT=client_accepts)
@@ -211,9 +217,12 @@ def test_unacceptable_types():
     msid = 16695
     ajson_fixture_v1 = join(base.FIXTURE_DIR, "ajson", "elife-16695-v1.xml.json")
     poa_fixture = json.load(open(ajson_fixture_v1, "r"))["article"]
-    mock = Mock(article_json_v1=poa_fixture, status="poa")
+    mock = Mock(article_json_v1=poa_fixture, status="poa", content_type_versions=None)
 
-    with patch("publisher.logic.most_recent_article_version", return_value=mock):
+    with patch("publisher.logic.most_recent_article_version", return_value=mock), patch(
+        "publisher.logic.article_json_text",
+        return_value=json.dumps(mock.article_json_v1),
+    ):
         for i, client_accepts in enumerate(cases):
             url = reverse("v2:article", kwargs={"msid": msid})
             resp = Client().get(url, HTTP_ACCEPT=client_accepts)
@@ -232,10 +241,13 @@ def test_structured_abstract_not_downgraded_vor():
         base.FIXTURE_DIR, "structured-abstracts", "elife-31549-v1.xml.json"
     )
     fixture = json.load(open(fixture_path, "r"))["article"]
-    mock = Mock(article_json_v1=fixture, status="vor")
+    mock = Mock(article_json_v1=fixture, status="vor", content_type_versions=None)
     vor_v3_ctype = "application/vnd.elife.article-vor+json; version=3"
 
-    with patch("publisher.logic.most_recent_article_version", return_value=mock):
+    with patch("publisher.logic.most_recent_article_version", return_value=mock), patch(
+        "publisher.logic.article_json_text",
+        return_value=json.dumps(mock.article_json_v1),
+    ):
         url = reverse("v2:article", kwargs={"msid": msid})
         resp = Client().get(url, HTTP_ACCEPT=vor_v3_ctype)
         assert 406 == resp.status_code
@@ -251,21 +263,59 @@ def test_structured_abstract_not_downgraded_poa():
     )
     fixture = json.load(open(fixture_path, "r"))["article"]
     fixture["status"] = "poa"
-    mock = Mock(article_json_v1=fixture, status="poa")
+    mock = Mock(article_json_v1=fixture, status="poa", content_type_versions=None)
     poa_v2_ctype = "application/vnd.elife.article-poa+json; version=2"
 
-    with patch("publisher.logic.most_recent_article_version", return_value=mock):
+    with patch("publisher.logic.most_recent_article_version", return_value=mock), patch(
+        "publisher.logic.article_json_text",
+        return_value=json.dumps(mock.article_json_v1),
+    ):
         url = reverse("v2:article", kwargs={"msid": msid})
         resp = Client().get(url, HTTP_ACCEPT=poa_v2_ctype)
         assert 406 == resp.status_code
 
 
+def test_precomputed_content_type_versions():
+    "the stored content-type versions are used to downgrade content without checking the body"
+    msid = 16695
+    fixture_path = join(base.FIXTURE_DIR, "ajson", "elife-16695-v1.xml.json")
+    fixture = json.load(open(fixture_path, "r"))["article"]
+    current_poa_type, previous_poa_type = settings.SCHEMA_VERSIONS["poa"][:2]
+    previous_ctype = (
+        "application/vnd.elife.article-poa+json; version=%s" % previous_poa_type
+    )
+    cases = [
+        ([current_poa_type, previous_poa_type], 200),
+        ([current_poa_type], 406),
+    ]
+    body_check = Mock()
+    for content_type_versions, expected_status in cases:
+        mock = Mock(
+            article_json_v1=fixture,
+            status="poa",
+            content_type_versions=content_type_versions,
+        )
+        with patch(
+            "publisher.logic.most_recent_article_version", return_value=mock
+        ), patch(
+            "publisher.logic.article_json_text", return_value=json.dumps(fixture)
+        ), patch.dict(
+            "publisher.fragment_logic.PREVIOUS_VERSION_CHECKS", {"poa": body_check}
+        ):
+            url = reverse("v2:article", kwargs={"msid": msid})
+            resp = Client().get(url, HTTP_ACCEPT=previous_ctype)
+            assert resp.status_code == expected_status
+            assert not body_check.called
+            if expected_status == 200:
+                assert resp.content_type == previous_ctype
+
+
 def test_related_downgraded():
     "related v1 content type requests prevents reviewed-preprints from being returned."
     msid = 123
     v1_ctype = "application/vnd.elife.article-related+json; version=1"
-    mock = []
-    with patch("publisher.logic.relationships2", return_value=mock) as patched:
+    mock = "[]"
+    with patch("publisher.logic.relationships_json", return_value=mock) as patched:
         url = reverse("v2:article-relations", kwargs={"msid": msid})
         resp = Client().get(url, HTTP_ACCEPT=v1_ctype)
         _, _, param_include_rpp = patched.call_args.args
@@ -279,13 +329,16 @@ def test_deprecated_header_present():
     msid = 16695
     fixture_path = join(base.FIXTURE_DIR, "ajson", "elife-16695-v1.xml.json")
     fixture = json.load(open(fixture_path, "r"))["article"]
-    mock = Mock(article_json_v1=fixture, status="poa")
+    mock = Mock(article_json_v1=fixture, status="poa", content_type_versions=None)
     previous_poa_type = settings.SCHEMA_VERSIONS["poa"][1]
     deprecated_ctype = (
         "application/vnd.elife.article-poa+json; version=%s" % previous_poa_type
     )
 
-    with patch("publisher.logic.most_recent_article_version", return_value=mock):
+    with patch("publisher.logic.most_recent_article_version", return_value=mock), patch(
+        "publisher.logic.article_json_text",
+        return_value=json.dumps(mock.article_json_v1),
+    ):
         url = reverse("v2:article", kwargs={"msid": msid})
         resp = Client().get(url, HTTP_ACCEPT=deprecated_ctype)
         assert resp.content_type == deprecated_ctype
@@ -596,6 +649,132 @@ class V2Content(base.BaseCase):
         resp = self.c.get(reverse("v2:article", kwargs={"msid": fake_msid}))
         self.assertEqual(resp.status_code, 404)
 
+    # conditional requests
+
+    def test_article_etag(self):
+        "article responses have an ETag derived from the article-json hash and the content-type version"
+        resp = self.c.get(reverse("v2:article", kwargs={"msid": self.msid1}))
+        self.assertEqual(resp.status_code, 200)
+        av = logic.most_recent_article_version(self.msid1)
+        latest_art_vor_type = settings.SCHEMA_VERSIONS["vor"][0]
+        expected = '"%s-v%s"' % (av.article_json_hash, latest_art_vor_type)
+        self.assertEqual(resp["ETag"], expected)
+
+    def test_article_json_passthrough(self):
+        "the stored article-json is returned as-is, byte for byte"
+        resp = self.c.get(reverse("v2:article", kwargs={"msid": self.msid1}))
+        self.assertEqual(resp.status_code, 200)
+        av = logic.most_recent_article_version(self.msid1)
+        self.assertEqual(resp.content.decode("utf-8"), logic.article_json_text(av))
+        self.assertEqual(resp.json(), logic.article_json(av))
+
+    def test_article_json_gzip(self):
+        "the stored gzip encoding of the article-json is returned to clients that accept it"
+        url = reverse("v2:article", kwargs={"msid": self.msid1})
+        plain = self.c.get(url)
+        resp = self.c.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+        self.assertEqual(resp["Content-Type"], plain["Content-Type"])
+        for r in [plain, resp]:
+            self.assertIn("Accept-Encoding", r["Vary"])
+
+        # each encoding has its own ETag
+        self.assertEqual(resp["ETag"], plain["ETag"][:-1] + '-gzip"')
+        resp = self.c.get(
+            url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=resp["ETag"]
+        )
+        self.assertEqual(resp.status_code, 304)
+
+    def test_article_json_gzip_not_stored(self):
+        "the article-json is returned uncompressed if a gzip encoding hasn't been stored yet"
+        url = reverse("v2:article", kwargs={"msid": self.msid1})
+        models.ArticleVersionJSON.objects.update(article_json_v1_gzip=None)
+        resp = self.c.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(resp["ETag"], self.c.get(url)["ETag"])
+
+    def test_article_head(self):
+        "HEAD requests return the same headers as GET requests without loading the article-json"
+        for url in [
+            reverse("v2:article", kwargs={"msid": self.msid1}),
+            reverse("v2:article-version", kwargs={"msid": self.msid1, "version": 1}),
+        ]:
+            for encoding in ["", "gzip"]:
+                get = self.c.get(url, HTTP_ACCEPT_ENCODING=encoding)
+                with self.assertNumQueries(1):
+                    head = self.c.head(url, HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(head.status_code, 200)
+                self.assertEqual(head.content, b"")
+                self.assertEqual(head["Content-Length"], str(len(get.content)))
+                for header in ["Content-Type", "ETag", "Vary"]:
+                    self.assertEqual(head[header], get[header])
+                self.assertEqual(
+                    head.get("Content-Encoding"), get.get("Content-Encoding")
+                )
+
+    def test_article_head_length_not_stored(self):
+        "HEAD requests load the article-json if its size hasn't been stored yet"
+        url = reverse("v2:article", kwargs={"msid": self.msid1})
+        models.ArticleVersion.objects.update(article_json_v1_length=None)
+        get = self.c.get(url)
+        head = self.c.head(url)
+        self.assertEqual(head.status_code, 200)
+        self.assertEqual(head["Content-Length"], str(len(get.content)))
+        self.assertEqual(head["ETag"], get["ETag"])
+
+    def test_article_etag_content_type_version(self):
+        "the ETag for the same article-json differs between content-type versions"
+        url = reverse("v2:article", kwargs={"msid": self.msid2})
+        previous_poa_type = settings.SCHEMA_VERSIONS["poa"][1]
+        deprecated_ctype = (
+            "application/vnd.elife.article-poa+json; version=%s" % previous_poa_type
+        )
+        resp = self.c.get(url, HTTP_ACCEPT=deprecated_ctype)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["ETag"].endswith('-v%s"' % previous_poa_type))
+        self.assertNotEqual(resp["ETag"], self.c.get(url)["ETag"])
+
+    def test_article_not_modified(self):
+        "a matching 'If-None-Match' header returns a HTTP 304 without loading the article-json"
+        url = reverse("v2:article", kwargs={"msid": self.msid1})
+        etag = self.c.get(url)["ETag"]
+        with self.assertNumQueries(1):
+            resp = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+        self.assertEqual(resp.content, b"")
+
+    def test_article_not_modified_unacceptable(self):
+        "a HTTP 406 is returned instead of a HTTP 304 when the content-type can't be negotiated"
+        url = reverse("v2:article", kwargs={"msid": self.msid2})
+        current_poa_type, previous_poa_type = settings.SCHEMA_VERSIONS["poa"][:2]
+        models.ArticleVersion.objects.update(content_type_versions=[current_poa_type])
+        cases = [
+            "application/vnd.elife.article-poa+json; version=%s" % previous_poa_type,
+            "application/vnd.elife.article-poa+json; version=99",
+            "application/vnd.elife.article-vor+json",
+        ]
+        for accept in cases:
+            resp = self.c.get(url, HTTP_ACCEPT=accept, HTTP_IF_NONE_MATCH="*")
+            self.assertEqual(resp.status_code, 406, accept)
+
+    def test_article_version_not_modified(self):
+        "a weakened but otherwise matching 'If-None-Match' header returns a HTTP 304"
+        url = reverse("v2:article-version", kwargs={"msid": self.msid1, "version": 1})
+        etag = self.c.get(url)["ETag"]
+        resp = self.c.get(url, HTTP_IF_NONE_MATCH="W/" + etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_article_modified(self):
+        "a stale 'If-None-Match' header returns the article-json"
+        url = reverse("v2:article", kwargs={"msid": self.msid1})
+        resp = self.c.get(url, HTTP_IF_NONE_MATCH='"foo-v1", "bar-v2"')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(utils.json_loads(resp.content)["version"], 3)
+
     # /articles/{id}/versions
 
     def test_article_versions_list(self):
@@ -1472,10 +1651,161 @@ class RequestArgs(base.BaseCase):
         id_list = [int(row["id"]) for row in data["items"]]
         self.assertEqual(id_list, [self.msid1, self.msid2])
 
+    def test_article_list_next_link(self):
+        "a full page of results links to the next page with a cursor"
+        resp = self.c.get(reverse("v2:article-list") + "?per-page=1")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Link"].endswith('>; rel="next"'))
+        self.assertIn("cursor=", resp["Link"])
+
+        # too few results for a second page
+        resp = self.c.get(reverse("v2:article-list"))
+        self.assertFalse(resp.has_header("Link"))
+
+    def test_article_list_cursor(self):
+        "a list of articles can be paginated by following the cursor in the 'Link' header"
+        for client in [self.c, self.ac]:
+            for order, expected in [
+                ("desc", [self.msid1, self.msid2]),
+                ("asc", [self.msid2, self.msid1]),
+            ]:
+                id_list = []
+                url = reverse("v2:article-list") + "?per-page=1&order=" + order
+                while url:
+                    resp = client.get(url)
+                    self.assertEqual(resp.status_code, 200)
+                    data = resp.json()
+                    self.assertEqual(data["total"], 2)
+                    id_list.extend(int(row["id"]) for row in data["items"])
+                    url = resp.has_header("Link") and resp["Link"][1:].split(">")[0]
+                self.assertEqual(id_list, expected)
+
+    def test_article_list_cursor_unpublished(self):
+        "unpublished article versions are paginated with a cursor"
+        self.unpublish(self.msid2, version=3)
+        url = reverse("v2:article-list") + "?per-page=1&order=desc"
+        resp = self.ac.get(url)
+        self.assertEqual(resp.json()["items"][0]["id"], str(self.msid2))
+        resp = self.ac.get(resp["Link"][1:].split(">")[0])
+        self.assertEqual(resp.json()["items"][0]["id"], str(self.msid1))
+
+    def test_article_list_batch(self):
+        "specific articles can be requested in a single request, in the order given"
+        url = reverse("v2:article-list")
+        with self.assertNumQueries(1):
+            resp = self.c.get(url, {"id": "%s,%s,999" % (self.msid2, self.msid1)})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(
+            [item["id"] for item in data["items"]], [str(self.msid2), str(self.msid1)]
+        )
+
+    def test_article_list_batch_unpublished(self):
+        "unpublished article versions are only returned to authenticated requests"
+        self.unpublish(self.msid2, version=3)
+        url = reverse("v2:article-list")
+        resp = self.c.get(url, {"id": self.msid2})
+        self.assertEqual(resp.json()["items"][0]["version"], 2)
+        resp = self.ac.get(url, {"id": self.msid2})
+        self.assertEqual(resp.json()["items"][0]["version"], 3)
+
+    def test_article_export(self):
+        "the snippet of the most recent version of every article is streamed, one per line"
+        resp = self.c.get(reverse("v2:article-export"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        lines = b"".join(resp.streaming_content).decode("utf-8").splitlines()
+        items = lmap(json.loads, lines)
+        self.assertEqual(
+            [item["id"] for item in items], [str(self.msid2), str(self.msid1)]
+        )
+        self.assertEqual([item["version"] for item in items], [3, 3])
+
+    def test_article_export_unpublished(self):
+        "the full article-json of unpublished article versions is only exported to authenticated requests"
+        self.unpublish(self.msid2, version=3)
+        url = reverse("v2:article-export") + "?content=article-json"
+        for client, expected in [(self.c, 2), (self.ac, 3)]:
+            resp = client.get(url)
+            lines = b"".join(resp.streaming_content).decode("utf-8").splitlines()
+            item = json.loads(lines[0])
+            self.assertEqual(item["version"], expected)
+            self.assertIn("authors", item)
+
+    @override_settings(DATABASE_REPLICA="replica")
+    def test_article_export_replica(self):
+        "the export is read from the replica for unauthenticated requests, even though it's streamed"
+
+        def db_for_read(router, model, **hints):
+            # there is no replica in this test, only the export's alias is checked
+            if model is models.ArticleVersionJSON and routers.reading_from_replica():
+                return "replica"
+            return "default"
+
+        objects = models.ArticleVersionJSON.objects
+        for client, expected in [(self.c, "replica"), (self.ac, "default")]:
+            with patch.object(routers.ReplicaRouter, "db_for_read", db_for_read):
+                with patch.object(
+                    objects,
+                    "using",
+                    side_effect=lambda alias: objects.get_queryset().using("default"),
+                ) as using:
+                    resp = client.get(reverse("v2:article-export"))
+                    content = b"".join(resp.streaming_content)
+            using.assert_called_once_with(expected)
+            self.assertEqual(len(content.decode("utf-8").splitlines()), 2)
+
+    def test_article_export_gzip(self):
+        "the export is compressed if the client accepts gzip"
+        resp = self.c.get(reverse("v2:article-export"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        content = gzip.decompress(b"".join(resp.streaming_content))
+        self.assertEqual(len(content.decode("utf-8").splitlines()), 2)
+
+    def test_article_export_command(self):
+        "the export can be written to a file with a management command"
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = join(tempdir, "export.ndjson.gz")
+            retcode, _ = self.call_command(
+                "export_articles", "--gzip", "--output", path
+            )
+            self.assertEqual(retcode, 0)
+            with gzip.open(path, "rt") as fh:
+                items = lmap(json.loads, fh)
+        self.assertEqual(
+            [item["id"] for item in items], [str(self.msid2), str(self.msid1)]
+        )
+
+    def test_article_export_bad_content(self):
+        resp = self.c.get(reverse("v2:article-export") + "?content=pants")
+        self.assertEqual(resp.status_code, 400)
+
     #
     # bad requests
     #
 
+    def test_article_list_bad_cursor(self):
+        "unrecognised cursors and cursors used with 'page' are bad requests"
+        for cursor in ["foo", "W10=", "WyJmb28iLCAxXQ=="]:
+            resp = self.c.get(reverse("v2:article-list"), {"cursor": cursor})
+            self.assertEqual(resp.status_code, 400, cursor)
+
+        resp = self.c.get(reverse("v2:article-list") + "?per-page=1")
+        cursor = resp["Link"].split("cursor=")[1].split(">")[0]
+        resp = self.c.get(reverse("v2:article-list") + "?page=2&cursor=" + cursor)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_article_list_bad_batch(self):
+        "article IDs must be positive integers and there can't be too many of them"
+        too_many = ",".join(
+            str(i) for i in range(1, settings.API_OPTS["max_per_page"] + 2)
+        )
+        for ids in ["foo", "1,foo", "-1", "", too_many]:
+            resp = self.c.get(reverse("v2:article-list"), {"id": ids})
+            self.assertEqual(resp.status_code, 400, ids)
+
     def test_article_list_bad_min_max_perpage(self):
         "per-page value must be between known min and max values"
         resp = self.c.get(reverse("v2:article-list") + "?per-page=-1")
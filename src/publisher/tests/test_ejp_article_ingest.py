@@ -1,5 +1,6 @@
 from . import base
 from os.path import join
+from unittest.mock import patch
 from publisher import logic, models, ejp_ingestor, utils
 from dateutil import parser
 
@@ -33,6 +34,18 @@ class EJPIngest(base.BaseCase):
         ejp_ingestor.import_article(self.journal, data, create=False)
         self.assertEqual(models.Article.objects.count(), 0)
 
+    def test_ejp_ingest_evicts_cached_responses(self):
+        "cached responses for an article are evicted once its ejp data is committed"
+        with patch("publisher.ejp_ingestor.response_cache.evict") as evict:
+            with self.captureOnCommitCallbacks(execute=True):
+                ejp_ingestor.import_article_list_from_json_path(
+                    self.journal, self.tiny_json_path
+                )
+                self.assertFalse(evict.called)
+        self.assertEqual(evict.call_count, 6)
+        art = models.Article.objects.get(manuscript_id=11835)
+        evict.assert_any_call(art.manuscript_id)
+
     def test_ejp_ingest_data(self):
         ejp_ingestor.import_article_list_from_json_path(
             self.journal, self.tiny_json_path
@@ -2,10 +2,12 @@ from os.path import join
 import json
 from . import base
 from unittest.mock import patch
-from publisher import fragment_logic as logic, ajson_ingestor, models
+from publisher import fragment_logic as logic, ajson_ingestor, models, utils
 from publisher.utils import StateError
 from datetime import datetime
 from django.test import override_settings
+from django.db import transaction
+from django.conf import settings
 import pytest
 from jsonschema import ValidationError
 
@@ -90,6 +92,12 @@ class FragmentMerge(base.BaseCase):
         self.version = self.ajson["article"]["version"]  # v1
         self.av = ajson_ingestor.ingest_publish(self.ajson)
 
+    def test_content_type_versions_stored(self):
+        "the content-type versions an article can be served as are stored with the article-json"
+        self.av.refresh_from_db()
+        expected = logic.content_type_versions("poa", self.av.article_json_v1)
+        self.assertEqual(self.av.content_type_versions, expected)
+
     def test_merge_fragments(self):
         logic.add(self.av, "xml->json", {"title": "foo"}, update=True)
         logic.add(self.msid, "frag1", {"body": "bar"})
@@ -335,6 +343,7 @@ def test_extract_snippet_empty_cases():
         assert expected == logic.extract_snippet(case)
 
 
+@pytest.mark.django_db
 def test_valid_snippet():
     "snippets can be validated."
     ajson_fixture = join(base.FIXTURE_DIR, "ajson", "elife-01968-v1.xml.json")
@@ -343,6 +352,7 @@ def test_valid_snippet():
     assert snippet == logic.valid_snippet(snippet, quiet=False)
 
 
+@pytest.mark.django_db
 def test_invalid_snippet():
     "snippets can be validated, invalid data raise a `ValidationError` or return None if `quiet=True`."
     ajson_fixture = join(base.FIXTURE_DIR, "ajson", "elife-01968-v1.xml.json")
@@ -352,3 +362,115 @@ def test_invalid_snippet():
     assert not logic.valid_snippet(snippet, quiet=True)
     with pytest.raises(ValidationError):
         logic.valid_snippet(snippet, quiet=False)
+
+
+def test_content_type_versions():
+    "article-json that can't be served as the previous content-type version isn't marked as such."
+    current_poa, previous_poa = settings.SCHEMA_VERSIONS["poa"][:2]
+    cases = [
+        ({"funding": {"awards": [{"recipients": []}]}}, [current_poa, previous_poa]),
+        ({"funding": {"awards": [{}]}}, [current_poa]),
+    ]
+    for given, expected in cases:
+        assert logic.content_type_versions("poa", given) == expected
+
+
+class ValidationCache(base.BaseCase):
+    schema = {
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "type": "object",
+        "required": ["status", "title"],
+    }
+
+    def setUp(self):
+        self.schema_path = "test-%s.json" % self.id()
+        for patcher in [
+            patch.dict(settings.SCHEMA_MAP, {self.schema_path: self.schema}),
+            patch.dict(settings.ALL_SCHEMA_IDX, {"vor": [(1, self.schema_path)]}),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.ajson = {
+            "status": "vor",
+            "title": "foo",
+            "published": datetime(2001, 1, 1),
+        }
+        self.validate = patch("publisher.utils.validate", wraps=utils.validate)
+
+    def test_valid_article_json_recorded(self):
+        "article-json found to be valid isn't validated again"
+        expected = {
+            "status": "vor",
+            "title": "foo",
+            "published": "2001-01-01T00:00:00Z",
+        }
+        with self.validate as validate:
+            self.assertEqual(logic.valid(self.ajson), expected)
+            self.assertEqual(logic.valid(self.ajson), expected)
+        self.assertEqual(validate.call_count, 1)
+        self.assertEqual(models.ValidationResult.objects.count(), 1)
+
+    def test_recorded_after_rollback(self):
+        "article-json found to be valid during an ingest that is rolled back is still recorded"
+        path = join(self.fixture_dir, "ajson", "elife-01968-v1.xml.json")
+        ajson_ingestor.ingest(self.load_ajson(path), dry_run=True)
+        self.assertEqual(models.ArticleVersion.objects.count(), 0)
+        results = models.ValidationResult.objects.filter(schema=self.schema_path)
+        self.assertEqual(results.count(), 1)
+
+    def test_rolled_back(self):
+        "article-json found to be valid in a transaction that is rolled back isn't recorded"
+        with self.validate as validate:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                logic.valid(self.ajson)
+                raise RuntimeError("rollback")
+            logic.valid(self.ajson)
+        self.assertEqual(validate.call_count, 2)
+
+    def test_pruned(self):
+        "results for schemas that have changed or are no longer used are pruned"
+        for schema, schema_hash in [
+            (self.schema_path, utils.schema_hash(self.schema_path)),
+            (self.schema_path, "changed"),
+            ("unknown.json", "foo"),
+        ]:
+            models.ValidationResult.objects.create(
+                content_hash="bar", schema=schema, schema_hash=schema_hash
+            )
+        self.assertEqual(logic.prune_validation_results(), 2)
+        (result,) = models.ValidationResult.objects.all()
+        self.assertEqual(result.schema_hash, utils.schema_hash(self.schema_path))
+
+    def test_changed_article_json_validated(self):
+        "article-json that has changed is validated again"
+        with self.validate as validate:
+            logic.valid(self.ajson)
+            self.ajson["title"] = "bar"
+            logic.valid(self.ajson)
+        self.assertEqual(validate.call_count, 2)
+
+    def test_invalid_article_json_not_recorded(self):
+        "article-json that isn't valid is always validated"
+        del self.ajson["title"]
+        with self.validate as validate:
+            self.assertFalse(logic.valid(self.ajson))
+            self.assertRaises(ValidationError, logic.valid, self.ajson, quiet=False)
+        self.assertEqual(validate.call_count, 2)
+        self.assertEqual(models.ValidationResult.objects.count(), 0)
+
+    def test_changed_schema(self):
+        "article-json is validated again when the schema changes"
+        with self.validate as validate:
+            logic.valid(self.ajson)
+            with patch.dict(utils._SCHEMA_HASHES, {self.schema_path: "changed"}):
+                logic.valid(self.ajson)
+        self.assertEqual(validate.call_count, 2)
+        self.assertEqual(models.ValidationResult.objects.count(), 2)
+
+    def test_disabled(self):
+        "article-json is always validated when the cache is disabled"
+        with override_settings(VALIDATION_CACHE=False), self.validate as validate:
+            logic.valid(self.ajson)
+            logic.valid(self.ajson)
+        self.assertEqual(validate.call_count, 2)
+        self.assertEqual(models.ValidationResult.objects.count(), 0)
@@ -65,6 +65,40 @@ class One(base.BaseCase):
             # throws a DoesNotExist if expected not in latest resultset
             self.assertEqual(latest_idx[msid].version, v)
 
+    def test_latest_versions_maintained(self):
+        "ingest and publish events keep the pointers to the latest article versions current"
+        art = models.Article.objects.get(manuscript_id=3401)
+        self.assertEqual(art.latest_articleversion.version, 3)
+        self.assertEqual(art.latest_published_articleversion.version, 3)
+
+        self.unpublish(3401, 3)
+        art.refresh_from_db()
+        self.assertEqual(art.latest_articleversion.version, 3)
+        self.assertEqual(art.latest_published_articleversion.version, 2)
+
+        ajson_ingestor.publish(3401, 3)
+        art.refresh_from_db()
+        self.assertEqual(art.latest_published_articleversion.version, 3)
+
+    def test_latest_article_version_list_queries(self):
+        "the article list doesn't depend on the number of articles"
+        with self.assertNumQueries(2):
+            total, latest = logic.latest_article_version_list()
+            [logic.article_snippet_json(av) for av in latest]
+        self.assertEqual(total, self.total_art_count)
+
+    def test_article_count_cached(self):
+        "article counts are cached until an article version is ingested or published"
+        self.assertEqual(logic.article_count(), self.total_art_count)
+        with self.assertNumQueries(0):
+            self.assertEqual(logic.article_count(), self.total_art_count)
+
+        self.unpublish(9571, 1)
+        self.assertEqual(logic.article_count(), self.total_art_count - 1)
+        self.assertEqual(
+            logic.article_count(only_published=False), self.total_art_count
+        )
+
     def test_latest_article_version_list_wrapper(self):
         unpublish_these = [(9571, 1)]
         for msid, version in unpublish_these:
@@ -173,6 +207,25 @@ class Two(base.BaseCase):
         avl = logic.article_version_list(self.msid2)
         self.assertEqual(avl.count(), expected_published_versions)
 
+    def test_article_json_stored_apart(self):
+        "the article-json of an article version is stored in its own table and loaded only when accessed"
+        av = models.ArticleVersion.objects.get(article__manuscript_id=self.msid1)
+        rendered = models.ArticleVersionJSON.objects.get(articleversion=av)
+        with self.assertNumQueries(1):
+            self.assertEqual(av.article_json_v1, rendered.article_json_v1)
+        self.assertEqual(av.article_json_v1_snippet, rendered.article_json_v1_snippet)
+        self.assertEqual(
+            logic.article_json_text(av), utils.json_dumps(rendered.article_json_v1)
+        )
+
+    def test_latest_article_versions_snippets(self):
+        "lists of article versions select their snippets but not their article-json"
+        with self.assertNumQueries(1):
+            avl = logic.latest_article_versions([self.msid1, self.msid2])
+            snippets = [logic.article_snippet_json(av) for av in avl]
+        self.assertEqual([s["id"] for s in snippets], ["01968", "16695"])
+        self.assertEqual(snippets[1]["version"], 3)
+
     def test_article_version_list_only_published(self):
         "all PUBLISHED versions of an article are returned"
         self.unpublish(self.msid2, version=3)
@@ -315,6 +368,54 @@ class ArticleHistoryV2(base.BaseCase):
             self.assertTrue("accepted" not in resp)
 
 
+class StoredArticleHistory(base.BaseCase):
+    def setUp(self):
+        self.msid = 16695
+        ajson_dir = join(self.fixture_dir, "ajson")
+        for ingestable in ["elife-16695-v1.xml.json", "elife-16695-v2.xml.json"]:
+            path = join(ajson_dir, ingestable)
+            ajson_ingestor.ingest_publish(json.load(open(path, "r")))
+
+    def test_history_stored(self):
+        "history documents are rendered on publish and fetched in a single query"
+        for (version, only_published), field in logic.HISTORY_FIELDS.items():
+            expected = logic.render_history(self.msid, version, only_published)
+            with self.assertNumQueries(1):
+                actual = logic.article_version_history_json(
+                    self.msid, version, only_published
+                )
+            self.assertEqual(utils.json_dumps(expected), actual)
+
+    def test_history_updated(self):
+        "history documents are updated when an article version is unpublished"
+        self.unpublish(self.msid, version=2)
+        published = json.loads(logic.article_version_history_json(self.msid, 2))
+        self.assertEqual(len(published["versions"]), 1)
+        unpublished = json.loads(
+            logic.article_version_history_json(self.msid, 2, only_published=False)
+        )
+        self.assertEqual(len(unpublished["versions"]), 2)
+
+    def test_history_not_stored(self):
+        "history documents are rendered if they haven't been stored yet"
+        models.ArticleHistory.objects.all().delete()
+        expected = utils.json_dumps(logic.render_history(self.msid, 1))
+        self.assertEqual(expected, logic.article_version_history_json(self.msid, 1))
+
+    def test_history_no_versions(self):
+        self.unpublish(self.msid)
+        for version in [1, 2]:
+            self.assertRaises(
+                models.Article.DoesNotExist,
+                logic.article_version_history_json,
+                self.msid,
+                version,
+            )
+        self.assertRaises(
+            models.Article.DoesNotExist, logic.article_version_history_json, 42, 2
+        )
+
+
 class RelationshipLogic(base.BaseCase):
     def setUp(self):
         ingest_these = [
@@ -362,6 +463,25 @@ class RelationshipLogic(base.BaseCase):
             [logic.article_snippet_json(av1)], logic.relationships(self.msid2)
         )
 
+    def test_relationships2(self):
+        "all relationships are fetched in a single query and match the ORM implementation"
+        create_relationships = [(self.msid1, [self.msid2, self.msid3])]
+        base._relate_using_msids(create_relationships)
+        base._relate_using_msids([(self.msid3, [self.msid1])])
+        for msid in [self.msid1, self.msid2, self.msid3]:
+            with self.assertNumQueries(1):
+                actual = logic.relationships2(msid)
+            self.assertEqual(logic.relationships(msid), actual)
+        self.assertEqual(len(logic.relationships2(self.msid1)), 2)
+
+    def test_warm_up(self):
+        "the raw SQL queries can be primed before any requests are served"
+        with self.assertNumQueries(len(logic.SQL_WARM_UP_PARAMS)):
+            logic.warm_up()
+
+    def test_relationships2_missing(self):
+        self.assertRaises(models.Article.DoesNotExist, logic.relationships2, 42)
+
     def test_relationship_data2(self):
         "we expect to see the article snippet of the relationed article and external citations"
         create_relationships = [(self.msid1, [self.msid2])]  # 1 => 2
@@ -0,0 +1,204 @@
+from os.path import join
+import json
+import os
+import tempfile
+from unittest.mock import patch
+from django.test import Client, override_settings
+from django.urls import reverse
+from core import metrics
+from publisher import ajson_ingestor, fragment_logic, codes
+from publisher.utils import StateError
+from . import base
+
+
+def value(name, **labels):
+    "returns the current value of the sample `name` with the given labels"
+    return metrics.REGISTRY.collect()[(name, tuple(labels.items()))]
+
+
+def written(path):
+    "returns the values written to the metrics file at `path`"
+    with open(path, "r") as fh:
+        return json.load(fh)
+
+
+class Registry(base.SimpleBaseCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = metrics.Counter(
+            self.registry, "test_total", "test counter", ("result",)
+        )
+        self.histogram = metrics.Histogram(
+            self.registry, "test_seconds", "test histogram", buckets=(0.1, 1)
+        )
+
+    def test_counter(self):
+        "counters are incremented per set of labels"
+        self.counter.inc(result="hit")
+        self.counter.inc(result="hit")
+        self.counter.inc(result="miss")
+        totals = self.registry.collect()
+        self.assertEqual(totals[("test_total", (("result", "hit"),))], 2)
+        self.assertEqual(totals[("test_total", (("result", "miss"),))], 1)
+
+    def test_counter_labels(self):
+        "counters must be given all of their labels"
+        with self.assertRaises(AssertionError):
+            self.counter.inc()
+
+    def test_exposition(self):
+        "metrics are exposed in the Prometheus text format"
+        self.counter.inc(result="hit")
+        self.histogram.observe(0.5)
+        expected = "\n".join(
+            [
+                "# HELP test_total test counter",
+                "# TYPE test_total counter",
+                'test_total{result="hit"} 1',
+                "# HELP test_seconds test histogram",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{le="0.1"} 0',
+                'test_seconds_bucket{le="1"} 1',
+                'test_seconds_bucket{le="+Inf"} 1',
+                "test_seconds_sum 0.5",
+                "test_seconds_count 1",
+                "",
+            ]
+        )
+        self.assertEqual(self.registry.exposition(), expected)
+
+    def test_multiple_processes(self):
+        "the values written by other processes are summed with this process's values"
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with override_settings(METRICS_DIR=metrics_dir):
+                self.counter.inc(result="hit")
+                self.registry.write()
+                # another worker
+                os.rename(self.registry.path(os.getpid()), self.registry.path(1))
+                self.counter.inc(result="hit")
+                totals = self.registry.collect()
+        self.assertEqual(totals[("test_total", (("result", "hit"),))], 3)
+
+    def test_exited_processes_archived(self):
+        "the values of processes that have exited are moved into a single archive file"
+        hit = ("test_total", (("result", "hit"),))
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with override_settings(METRICS_DIR=metrics_dir):
+                for pid in [99999998, 99999999]:
+                    with open(self.registry.path(pid), "w") as fh:
+                        json.dump([["test_total", [["result", "hit"]], 1]], fh)
+                self.counter.inc(result="hit")
+                self.assertEqual(self.registry.collect()[hit], 3)
+                self.assertEqual(
+                    sorted(f for f in os.listdir(metrics_dir) if f.endswith(".json")),
+                    sorted([metrics.ARCHIVE, "metrics-%s.json" % os.getpid()]),
+                )
+                # archived values are counted once
+                self.assertEqual(self.registry.collect()[hit], 3)
+
+    def test_flush(self):
+        "values added since they were last written are written when collected or flushed"
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with override_settings(METRICS_DIR=metrics_dir), patch.object(
+                metrics, "WRITE_INTERVAL", 60
+            ):
+                path = self.registry.path(os.getpid())
+                self.counter.inc(result="hit")
+                self.counter.inc(result="hit")
+                self.assertEqual(
+                    written(path), [["test_total", [["result", "hit"]], 1]]
+                )
+                self.registry.collect()
+                self.assertEqual(
+                    written(path), [["test_total", [["result", "hit"]], 2]]
+                )
+                self.counter.inc(result="hit")
+                self.registry.flush()
+                self.assertEqual(
+                    written(path), [["test_total", [["result", "hit"]], 3]]
+                )
+
+    def test_fork(self):
+        "values copied from a parent process are discarded"
+        self.counter.inc(result="hit")
+        self.registry.pid = 1
+        self.assertEqual(self.registry.collect(), {})
+
+    def test_fork_flush(self):
+        "values copied from a parent process aren't written by the forked process"
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with override_settings(METRICS_DIR=metrics_dir):
+                self.counter.inc(result="hit")
+                self.registry.pid = 1
+                self.registry.flush()
+                self.registry.write()
+                self.assertEqual(written(self.registry.path(os.getpid())), [])
+
+
+class Endpoint(base.BaseCase):
+    def setUp(self):
+        self.c = Client()
+        ajson_dir = join(self.fixture_dir, "ajson")
+        self.ajson_fixture = join(ajson_dir, "elife-01968-v1.xml.json")
+
+    def test_metrics(self):
+        "all metrics are listed"
+        resp = self.c.get(reverse("metrics"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        content = resp.content.decode("utf-8")
+        for metric in metrics.REGISTRY.metrics:
+            self.assertIn("# TYPE %s " % metric, content)
+
+    def test_request_metrics(self):
+        "requests are counted and timed by view name and status"
+        view = "v2:article-list"
+        count = value("lax_http_request_duration_seconds_count", view=view)
+        requests = value(
+            "lax_http_requests_total", view=view, method="GET", status="200"
+        )
+        self.c.get(reverse(view))
+        self.assertEqual(
+            value("lax_http_request_duration_seconds_count", view=view), count + 1
+        )
+        self.assertEqual(
+            value("lax_http_requests_total", view=view, method="GET", status="200"),
+            requests + 1,
+        )
+
+    def test_ingest_outcomes(self):
+        "ingest outcomes are counted by error code"
+        data = self.load_ajson(self.ajson_fixture)
+        success = value("lax_ingest_total", action="ingest", outcome="success")
+        identical = value("lax_ingest_total", action="ingest", outcome="identical")
+        ajson_ingestor.ingest(data)
+        with self.assertRaises(fragment_logic.Identical):
+            ajson_ingestor.ingest(data)
+        self.assertEqual(
+            value("lax_ingest_total", action="ingest", outcome="success"), success + 1
+        )
+        self.assertEqual(
+            value("lax_ingest_total", action="ingest", outcome="identical"),
+            identical + 1,
+        )
+
+    def test_ingest_error_outcome(self):
+        "failed ingests are counted by their error code"
+        outcome = codes.NO_RECORD
+        before = value("lax_ingest_total", action="publish", outcome=outcome)
+        with self.assertRaises(StateError):
+            ajson_ingestor.publish(42, 1)
+        self.assertEqual(
+            value("lax_ingest_total", action="publish", outcome=outcome), before + 1
+        )
+
+    def test_validation_and_merge_timed(self):
+        "merging and validating article-json are timed"
+        validation = value("lax_validation_duration_seconds_count", schema="vor")
+        merges = value("lax_merge_duration_seconds_count")
+        with patch("publisher.aws_events.notify"):
+            ajson_ingestor.ingest(self.load_ajson(self.ajson_fixture))
+        self.assertGreater(
+            value("lax_validation_duration_seconds_count", schema="vor"), validation
+        )
+        self.assertGreater(value("lax_merge_duration_seconds_count"), merges)
@@ -1,4 +1,4 @@
-from publisher import api_v2_views, middleware
+from publisher import api_v2_views, middleware, fragment_logic
 from django.test import Client
 from django.urls import reverse
 from django.conf import settings
@@ -38,7 +38,60 @@ def test_all_awards_have_recipients():
         ),
     ]
     for given, expected in cases:
-        assert middleware.all_awards_have_recipients(given) == expected
+        assert fragment_logic.all_awards_have_recipients(given) == expected
+
+
+def test_parse_accept():
+    poa = "application/vnd.elife.article-poa+json"
+    current_poa_version = settings.SCHEMA_VERSIONS["poa"][0]
+    previous_poa_version = settings.SCHEMA_VERSIONS["poa"][1]
+    cases = [
+        ("*/*", False, {}),
+        (poa, False, {}),
+        (
+            "%s; version=%s" % (poa, current_poa_version),
+            False,
+            {poa: current_poa_version},
+        ),
+        (
+            "%s; version=%s, %s; version=%s"
+            % (poa, previous_poa_version, poa, current_poa_version),
+            True,
+            {poa: current_poa_version},
+        ),
+        (
+            "%s; version=%s" % (poa, previous_poa_version),
+            True,
+            {poa: previous_poa_version},
+        ),
+    ]
+    for given, expected_deprecated, expected_max_versions in cases:
+        negotiation = middleware.parse_accept(given)
+        assert negotiation.deprecated == expected_deprecated, given
+        assert negotiation.max_versions == expected_max_versions, given
+
+
+def test_parse_accept_versions():
+    "the content-type version each type of content will be served as is resolved up front"
+    poa = "application/vnd.elife.article-poa+json"
+    current_poa_version = settings.SCHEMA_VERSIONS["poa"][0]
+    previous_poa_version = settings.SCHEMA_VERSIONS["poa"][1]
+    current_related_version = settings.SCHEMA_VERSIONS["related"][0]
+    cases = [
+        ("*/*", current_poa_version, current_related_version),
+        (poa, current_poa_version, None),
+        ("%s; version=%s" % (poa, previous_poa_version), previous_poa_version, None),
+    ]
+    for given, expected_poa, expected_related in cases:
+        versions = middleware.parse_accept(given).versions
+        assert versions[settings.POA] == expected_poa, given
+        assert versions[settings.RELATED] == expected_related, given
+
+
+def test_parse_accept_memoized():
+    "an 'Accept' header is only parsed once"
+    accept = "application/vnd.elife.article-poa+json, */*"
+    assert middleware.parse_accept(accept) is middleware.parse_accept(accept)
 
 
 @skip("works by itself, but fails when called as part of test suite")
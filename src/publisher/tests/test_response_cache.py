@@ -0,0 +1,161 @@
+from os.path import join
+import json
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from core import middleware as mware
+from django.test import Client
+from django.urls import reverse
+from publisher import ajson_ingestor, models, response_cache
+from . import base
+from .test_aws_events import formsubgen
+
+
+class LRU(base.SimpleBaseCase):
+    def test_least_recently_used_discarded(self):
+        "the least recently used item is discarded when the cache is full"
+        cache = response_cache.LRUCache(2, 60)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(1), "a")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), "c")
+
+    def test_expired(self):
+        "expired items are not returned"
+        cache = response_cache.LRUCache(2, -1)
+        cache.set(1, "a")
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        "a cache with a maximum size of zero stores nothing"
+        cache = response_cache.LRUCache(0, 60)
+        cache.set(1, "a")
+        self.assertIsNone(cache.get(1))
+
+
+class ResponseCache(base.BaseCase):
+    def backend(self):
+        return response_cache.LocalBackend(10, 60)
+
+    def setUp(self):
+        self.msid = 16695
+        ajson_dir = join(self.fixture_dir, "ajson")
+        self.publish_ajson(join(ajson_dir, "elife-16695-v1.xml.json"))
+        self.ajson_v2 = self.load_ajson(join(ajson_dir, "elife-16695-v2.xml.json"))
+        self.url = reverse("v2:article", kwargs={"msid": self.msid})
+        self.c = Client()
+
+        patcher = patch.object(response_cache, "BACKEND", self.backend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        "a cached response is served without touching the database"
+        expected = self.c.get(self.url)
+        with self.assertNumQueries(0):
+            resp = self.c.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, expected.content)
+        self.assertEqual(resp["Content-Type"], expected["Content-Type"])
+        self.assertEqual(resp["ETag"], expected["ETag"])
+
+    def test_cached_not_modified(self):
+        "a cached response is not sent if the client's copy is current"
+        etag = self.c.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            resp = self.c.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertIn("Accept-Encoding", resp["Vary"])
+
+    def test_cached_not_modified_unacceptable(self):
+        "a cached response isn't answered with a HTTP 304 if the content-type can't be negotiated"
+        current_poa_type = settings.SCHEMA_VERSIONS["poa"][0]
+        models.ArticleVersion.objects.update(content_type_versions=[current_poa_type])
+        accept = "application/vnd.elife.article-poa+json; version=%s" % (
+            settings.SCHEMA_VERSIONS["poa"][1]
+        )
+        self.c.get(self.url, HTTP_ACCEPT=accept)
+        resp = self.c.get(self.url, HTTP_ACCEPT=accept, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(resp.status_code, 406)
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    def test_counters(self):
+        "cache hits and misses are counted"
+        self.c.get(self.url)
+        self.c.get(self.url)
+        self.c.get(self.url, HTTP_ACCEPT="application/vnd.elife.article-poa+json")
+        stats = response_cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_errors_not_cached(self):
+        "only successful responses are cached"
+        url = reverse("v2:article", kwargs={"msid": 42})
+        self.c.get(url)
+        self.assertEqual(self.c.get(url).status_code, 404)
+        self.assertEqual(response_cache.stats()["hits"], 0)
+
+    def test_evicted_on_publish(self):
+        "cached responses for an article are evicted once a new version is published"
+        self.c.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ajson_ingestor.ingest_publish(self.ajson_v2)
+        self.assertEqual(self.c.get(self.url).json()["version"], 2)
+        self.assertEqual(response_cache.stats()["hits"], 0)
+
+    def test_evicted_on_admin_save(self):
+        "cached responses for an article are evicted once changes from the admin are committed"
+        self.c.get(self.url)
+        user = get_user_model().objects.create_superuser(
+            "john", "john@example.org", "password"
+        )
+        ac = Client()
+        ac.force_login(user)
+        art = models.Article.objects.get(manuscript_id=self.msid)
+        url = reverse("admin:publisher_article_change", args=(art.id,))
+        with self.captureOnCommitCallbacks() as callbacks:
+            resp = ac.post(url, formsubgen(art), follow=False)
+            self.assertEqual(resp.status_code, 302)
+            # still cached until the transaction is committed
+            self.c.get(self.url)
+            self.assertEqual(response_cache.stats()["hits"], 1)
+        for callback in callbacks:
+            callback()
+        self.c.get(self.url)
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    def test_related_evicted_on_fragment_change(self):
+        "cached responses of related articles, that embed the article's snippet, are evicted when a fragment changes"
+        related_msid = 20105
+        self.publish_ajson(join(self.fixture_dir, "ajson", "elife-20105-v1.xml.json"))
+        base._relate_using_msids([(self.msid, [related_msid])])
+        related_url = reverse("v2:article-relations", kwargs={"msid": related_msid})
+        key = "test-frag"
+        fragment_url = reverse(
+            "v2:article-fragment", kwargs={"msid": self.msid, "fragment_id": key}
+        )
+        ac = Client(**{mware.CGROUPS: "view-unpublished-content"})
+        fragment = json.dumps({"title": "Electrostatic selection"})
+
+        for change in [
+            lambda: ac.post(fragment_url, fragment, content_type="application/json"),
+            lambda: ac.delete(fragment_url),
+        ]:
+            self.assertEqual(self.c.get(related_url).status_code, 200)
+            hits = response_cache.stats()["hits"]
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(change().status_code, 200)
+            self.c.get(related_url)
+            self.assertEqual(response_cache.stats()["hits"], hits)
+
+
+class SharedResponseCache(ResponseCache):
+    "the same tests using a Django cache shared between processes"
+
+    def backend(self):
+        return response_cache.SharedBackend("default", 60)
@@ -1,7 +1,12 @@
 import json
-from jsonschema import ValidationError
+from collections import OrderedDict
+from jsonschema import Draft4Validator, ValidationError
 from os.path import join
 import copy
+import random
+from functools import reduce
+import threading
+from unittest.mock import patch
 from publisher import utils, models, logic, ajson_ingestor
 from publisher.tests import base
 import pytz
@@ -137,6 +142,46 @@ class TestUtils(base.BaseCase):
         expected = '{"dt": "2001-01-01T00:00:59Z"}'
         self.assertEqual(utils.json_dumps(struct), expected)
 
+    def test_normalise(self):
+        "normalised data is the same as data that has been serialised and deserialised"
+        fixed_offset = pytz.FixedOffset(9.5 * 60)
+        struct = {
+            "dt": datetime(2001, 1, 1, 9, 30, 59, tzinfo=fixed_offset),
+            "date": date(2001, 1, 1),
+            "list": [1, 2.5, None, True, ("a", datetime(2001, 1, 1))],
+            "nested": {"foo": {"bar": "baz"}},
+        }
+        expected = {
+            "dt": "2001-01-01T00:00:59Z",
+            "date": "2001-01-01",
+            "list": [1, 2.5, None, True, ["a", "2001-01-01T00:00:00Z"]],
+            "nested": {"foo": {"bar": "baz"}},
+        }
+        self.assertEqual(utils.normalise(struct), expected)
+        self.assertEqual(json.loads(utils.json_dumps(struct)), expected)
+
+    def test_normalise_copy_on_write(self):
+        "the given data is never modified and is only copied where a value changes"
+        nested = {"foo": ["bar", {"baz": 1}]}
+        struct = {"dt": date(2001, 1, 1), "nested": nested}
+        original = copy.deepcopy(struct)
+        result = utils.normalise(struct)
+        self.assertEqual(struct, original)
+        self.assertIsNot(result, struct)
+        self.assertIs(result["nested"], nested)
+        self.assertIs(utils.normalise(nested), nested)
+
+    def test_normalise_ordered(self):
+        "the type and order of maps are preserved"
+        struct = OrderedDict([("b", date(2001, 1, 1)), ("a", 1)])
+        result = utils.normalise(struct)
+        self.assertIsInstance(result, OrderedDict)
+        self.assertEqual(list(result.items()), [("b", "2001-01-01"), ("a", 1)])
+
+    def test_normalise_unserialisable(self):
+        "values that can't be serialised to json raise a `TypeError`"
+        self.assertRaises(TypeError, utils.normalise, {"foo": [object()]})
+
     def test_resolve_paths(self):
         tests_dir = join(settings.SRC_DIR, "publisher", "tests", "fixtures")
         cases = [
@@ -390,6 +435,48 @@ class TestUtils(base.BaseCase):
             dict_list, expected = row[:-1], row[-1]
             self.assertEqual(utils.merge_all(dict_list), expected)
 
+    def test_merge_all_nested(self):
+        "nested maps aren't merged, the earlier map is kept"
+        dict_list = [{"a": {"x": 1}, "b": 1}, {"a": {"y": 2}, "b": {"z": 3}}]
+        expected = {"a": {"x": 1}, "b": {"z": 3}}
+        self.assertEqual(utils.merge_all(dict_list), expected)
+
+    def test_merge_all_shares_values(self):
+        "the given maps aren't modified and their values aren't copied"
+        first, second = {"a": {"x": 1}, "b": 1}, {"b": [2], "c": 3}
+        result = utils.merge_all([first, second])
+        self.assertEqual(first, {"a": {"x": 1}, "b": 1})
+        self.assertEqual(second, {"b": [2], "c": 3})
+        self.assertIs(result["a"], first["a"])
+        self.assertIs(result["b"], second["b"])
+
+    def test_merge_all_random(self):
+        "randomly generated maps are merged the same as with `deepmerge`"
+        rand = random.Random(42)
+        keys = ["a", "b", "c", "d"]
+
+        def value(depth):
+            choice = rand.randint(0, 3 if depth < 3 else 1)
+            if choice == 0:
+                return rand.choice([None, True, 1, 1.5, "foo"])
+            if choice == 1:
+                return rand.choice(keys)
+            if choice == 2:
+                return [value(depth + 1) for _ in range(rand.randint(0, 2))]
+            return mapping(depth + 1)
+
+        def mapping(depth=0):
+            return {key: value(depth) for key in rand.sample(keys, rand.randint(0, 4))}
+
+        for _ in range(500):
+            dict_list = [mapping() for _ in range(rand.randint(1, 5))]
+            original = copy.deepcopy(dict_list)
+            expected = reduce(utils.deepmerge, copy.deepcopy(dict_list))
+            result = utils.merge_all(dict_list)
+            self.assertEqual(result, expected)
+            self.assertEqual(list(result), list(expected))
+            self.assertEqual(dict_list, original)
+
 
 class ValidationFailureError(base.BaseCase):
     def setUp(self):
@@ -440,3 +527,59 @@ class ValidationFailureError(base.BaseCase):
 
             # the `trace` also contains the full dump of all sub-errors ('possibilities')
             self.assertTrue("(error 3, possibility 7)" in err.trace)
+
+
+class Validators(base.SimpleBaseCase):
+    schema = {
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "definitions": {"volume": {"type": "integer", "minimum": 1}},
+        "type": "object",
+        "required": ["status"],
+        "properties": {"volume": {"$ref": "#/definitions/volume"}},
+    }
+
+    def setUp(self):
+        self.schema_path = "test-%s.json" % self.id()
+        patcher = patch.dict(settings.SCHEMA_MAP, {self.schema_path: self.schema})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_validator_reused(self):
+        "a validator is created once per schema and thread"
+        validator = utils.validator(self.schema_path)
+        self.assertIsInstance(validator, Draft4Validator)
+        self.assertIs(utils.validator(self.schema_path), validator)
+
+        other_thread = []
+        thread = threading.Thread(
+            target=lambda: other_thread.append(utils.validator(self.schema_path))
+        )
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_thread[0], validator)
+
+    def test_schema_checked_once(self):
+        "a schema is checked against its meta-schema once"
+        with patch.object(Draft4Validator, "check_schema") as check_schema:
+            utils.validator(self.schema_path)
+            utils._VALIDATORS.cache.clear()
+            utils.validator(self.schema_path)
+        self.assertEqual(check_schema.call_count, 1)
+
+    def test_validate(self):
+        "valid data is returned, `$ref`s are resolved"
+        self.assertEqual(
+            utils.validate({"status": "poa", "volume": 1}, self.schema_path),
+            {"status": "poa", "volume": 1},
+        )
+
+    def test_validate_errors(self):
+        "all errors are attached to the most relevant error"
+        with self.assertRaises(ValidationError) as cm:
+            utils.validate({"volume": 0}, self.schema_path)
+        err = cm.exception
+        self.assertEqual(err.count, 2)
+        self.assertEqual(len(err.error_list), 2)
+        self.assertIn("(error 1 of 2)", err.message)
+        self.assertIn("'status' is a required property", err.message)
+        self.assertIn("0 is less than the minimum of 1", err.message)
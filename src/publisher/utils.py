@@ -1,8 +1,7 @@
 from collections import OrderedDict
-from functools import reduce
 import jsonschema
-from jsonschema.exceptions import relevance, ValidationError
-import os, copy, json, glob
+from jsonschema.exceptions import best_match, relevance
+import os, copy, json, glob, hashlib, threading, zlib
 import pytz
 from dateutil import parser
 from django.utils import timezone
@@ -334,6 +333,17 @@ def json_dumps(obj, **kwargs):
     return json.dumps(obj, default=_handler, **kwargs)
 
 
+def gzip_stream(string_iter, compresslevel=6):
+    "compresses an iterable of strings on the fly, yielding gzip-encoded bytes."
+    # wbits=31: deflate with a gzip header and trailer
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    for string in string_iter:
+        chunk = compressor.compress(string.encode("utf-8"))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
 def deepcopy_data(data):
     "a faster `deepcopy` for standard data. No support for objects."
     return json.loads(json.dumps(data))
@@ -351,11 +361,28 @@ def deepmerge(d1, d2):
 
 
 def merge_all(dict_list):
+    """merges each map in `dict_list` into the maps before it, returning a new map.
+    returns the same result as reducing `dict_list` with `deepmerge` without copying anything but
+    the top-level map. values are shared with the given maps, none of which are modified.
+    """
     ensure(
         all([isinstance(r, dict) for r in dict_list]),
         "not all given values are dictionaries!",
     )
-    return reduce(deepmerge, dict_list)
+    ensure(dict_list, "no dictionaries to merge!")
+    result = copy.copy(dict_list[0])
+    for dct in dict_list[1:]:
+        for key, val in dct.items():
+            # `deepmerge` discards the result of merging two nested maps, the earlier map is kept.
+            # article-json has always been merged this way.
+            if (
+                key in result
+                and isinstance(result[key], dict)
+                and isinstance(val, dict)
+            ):
+                continue
+            result[key] = val
+    return result
 
 
 def boolkey(*args):
@@ -377,33 +404,111 @@ def unique(seq):
 #
 
 
-def validate(struct, schema_path):
-    try:
-        # this has the effect of converting any datetime objects to rfc3339 formatted strings
-        struct = json.loads(json_dumps(struct))
-    except ValueError as err:
-        LOG.error("struct is not serializable: %s", err.message)
-        raise
+# paths of the schemas checked against their meta-schema, see `validator`
+_CHECKED_SCHEMAS = set()
 
-    try:
+# validators and their `$ref` resolvers are not thread-safe, each thread has it's own
+_VALIDATORS = threading.local()
+
+
+def validator(schema_path):
+    """returns a validator for the schema at `schema_path` in `settings.SCHEMA_MAP`.
+    the schema is checked once per process and the validator is created once per thread.
+    `$ref`s resolved by a validator are cached by it's resolver for as long as it lives.
+    """
+    cache = getattr(_VALIDATORS, "cache", None)
+    if cache is None:
+        cache = _VALIDATORS.cache = {}
+    if schema_path not in cache:
         schema = settings.SCHEMA_MAP[schema_path]
-        jsonschema.validate(struct, schema)
+        cls = jsonschema.validators.validator_for(schema)
+        if schema_path not in _CHECKED_SCHEMAS:
+            cls.check_schema(schema)
+            _CHECKED_SCHEMAS.add(schema_path)
+        cache[schema_path] = cls(schema)
+    return cache[schema_path]
+
+
+def canonical_hash(struct):
+    "returns an md5 hash of `struct` that doesn't depend on the order of keys in maps"
+    string = json_dumps(struct, sort_keys=True, separators=(",", ":"))
+    return hashlib.md5(string.encode("utf-8")).hexdigest()
+
+
+_SCHEMA_HASHES = {}
+
+
+def schema_hash(schema_path):
+    "returns the `canonical_hash` of the schema at `schema_path` in `settings.SCHEMA_MAP`, once per process"
+    if schema_path not in _SCHEMA_HASHES:
+        _SCHEMA_HASHES[schema_path] = canonical_hash(settings.SCHEMA_MAP[schema_path])
+    return _SCHEMA_HASHES[schema_path]
+
+
+# types that are left as-is by `normalise`
+_JSON_SCALARS = frozenset([str, int, float, bool, type(None)])
+
+
+def normalise(struct):
+    """returns `struct` as it would be after a `json.loads(json_dumps(struct))` round trip.
+    date and datetime objects become strings and tuples become lists.
+    nothing is modified in place, containers are copied only when something within them changes
+    and `struct` itself is returned when nothing changes."""
+    struct_t = type(struct)
+    if struct_t in _JSON_SCALARS:
+        return struct
+    if isinstance(struct, dict):
+        copied = None
+        for key, val in struct.items():
+            new_val = normalise(val)
+            if new_val is not val:
+                if copied is None:
+                    copied = copy.copy(struct)
+                copied[key] = new_val
+        return struct if copied is None else copied
+    if isinstance(struct, (list, tuple)):
+        copied = None
+        for i, val in enumerate(struct):
+            new_val = normalise(val)
+            if new_val is not val:
+                if copied is None:
+                    copied = list(struct)
+                copied[i] = new_val
+        if copied is None and struct_t is not list:
+            copied = list(struct)
+        return struct if copied is None else copied
+    if struct_t == date:
+        return ymd(struct)
+    if struct_t == datetime:
+        return ymdhms(struct)
+    if isinstance(struct, (str, int, float)):
+        # subclasses of the scalar types, like enums
         return struct
+    raise TypeError(
+        "Object of type %s with value of %s is not JSON serializable"
+        % (struct_t, repr(struct))
+    )
+
 
-    except ValueError:
-        # json schema is broken
-        # raise ValidationError("validation error: '%s' for: %s" % (err.message, struct))
+def validate(struct, schema_path):
+    try:
+        # converts any datetime objects to rfc3339 formatted strings
+        struct = normalise(struct)
+    except TypeError as err:
+        LOG.error("struct is not serializable: %s", err)
         raise
 
-    except ValidationError as err:
-        # json is incorrect
-        v = jsonschema.Draft4Validator(schema)
-        err.error_list = list(v.iter_errors(struct))
-        err.count = len(err.error_list)
-        err.message, err.trace = format_validation_error_list(
-            err.error_list, schema_path
-        )
-        raise err
+    # all errors are found in a single pass. the most relevant one is raised, like `jsonschema.validate`.
+    error_list = list(validator(schema_path).iter_errors(struct))
+    if not error_list:
+        return struct
+
+    # json is incorrect
+    err = best_match(error_list)
+    err.error_list = error_list
+    err.count = len(error_list)
+    err.message, err.trace = format_validation_error_list(error_list, schema_path)
+    raise err
 
 
 def flatten_validation_errors(error):
@@ -1,9 +1,19 @@
 import os
 from django.conf import settings
+from django.http import HttpResponse
 from annoying.decorators import render_to
+from core import metrics as core_metrics
 
 
 @render_to("publisher/landing.html")
 def landing(request):
     project_root = os.path.abspath(os.path.join(settings.SRC_DIR, ".."))
     return {"readme": open(os.path.join(project_root, "README.md")).read()}
+
+
+def metrics(request):
+    "all metrics, from all processes if a `METRICS_DIR` is configured, in the Prometheus text format."
+    return HttpResponse(
+        core_metrics.REGISTRY.exposition(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )